@@ -1,21 +1,64 @@
+import array
+import atexit
+import base64
+import bisect
+import collections
+import csv
+import functools
+import hashlib
+import json
 import logging
+import logging.handlers
+import operator
+import os
+import queue
+import random
+import re
+import sys
+import threading
 import time
+import zipfile
+import zlib
 import tkinter as tk
 from tkinter import filedialog
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.firefox.service import Service as FirefoxService
+from selenium.webdriver.firefox.options import Options as FirefoxOptions
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, TimeoutException, NoSuchWindowException
-from openpyxl import load_workbook
+from selenium.common.exceptions import (NoSuchElementException, TimeoutException, NoSuchWindowException,
+                                        StaleElementReferenceException)
+from openpyxl import load_workbook, Workbook
 from contextlib import contextmanager
 import contextlib
+import html
+import http.client
+import http.server
+import io
+import statistics
+import urllib.parse
+import urllib.request
+from html.parser import HTMLParser
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
-# 设置日志记录器的配置
-logging.basicConfig(level=logging.INFO, format='%(asctime)s || %(message)s')
 logger = logging.getLogger(__name__)
 
 # 添加配置常量
@@ -23,15 +66,980 @@ CONFIG = {
     'CHROME_DRIVER_PATH': 'D:\\chromedriver-win64\\chromedriver.exe',
     'CHROME_BINARY_PATH': 'C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe',
     'USER_DATA_DIR': 'C:\\Users\\Administrator\\AppData\\Local\\Google\\Chrome\\User Data',
+    # 浏览器: chrome / firefox；Firefox 配置文件路径保存在 FIREFOX_PROFILE_FILE 中
+    'BROWSER': 'chrome',
+    'GECKODRIVER_PATH': None,
+    'FIREFOX_BINARY_PATH': None,
+    'FIREFOX_PROFILE_FILE': 'firefox_profile.txt',
+    # 屏蔽的资源 URL 通配符，如 '*.mp4'、'*.woff2'
+    'BLOCKED_URL_PATTERNS': [],
+    # 页面加载策略: normal 等全部资源 / eager 等 DOM 就绪 / none 不等待；eager、none 依赖下方就绪条件
+    'PAGE_LOAD_STRATEGY': 'eager',
+    # 等待插件注入 Importify 按钮的时间，超时后回退为等待页面完全加载
+    'READY_GATE_TIMEOUT': 8,
     'WAIT_TIMEOUT': 10,
     'WAIT_TIMEOUT_LONG': 20,
     'SCROLL_WAIT': 1,
     'ANIMATION_WAIT': 0.5,
     'IMPORT_TIMEOUT': 60,
+    # 导入预算: 点击 addBtnSec 前在 Importify 面板中只保留部分变体和图片，0 表示不限制；
+    # 启用前先按实际面板核对选择器注册表中的 variant_rows / image_items
+    'MAX_VARIANTS': 0,
+    'MAX_IMAGES': 0,
+    # 变体保留规则: first 按页面顺序 / cheapest 价格最低优先 / stock 库存最多优先
+    'VARIANT_KEEP_RULE': 'first',
+    # 图片保留规则: first 按页面顺序（主图在前）/ variant 先保留已保留变体使用的图片
+    'IMAGE_KEEP_RULE': 'first',
     'RETRY_INTERVAL': 2,
-    'MAX_RETRIES': 3
+    'MAX_RETRIES': 3,
+    # 运行模式: full 搜索并导入 / harvest 只采集到 JSONL / import 从 JSONL 导入
+    'RUN_MODE': 'full',
+    'HARVEST_FILE': 'harvest.jsonl',
+    # 导入完成检测方式: dom 轮询面板文字 / network 监听 Chrome 网络事件
+    'IMPORT_DETECTION': 'dom',
+    # Importify 后端创建产品接口的 URL 正则
+    'IMPORTIFY_CREATE_URL_PATTERN': r'importify.*/(create|import|add)[-_]?product',
+    'NETWORK_POLL_INTERVAL': 0.2,
+    # 失败快照: 截图 + Importify 面板 HTML + URL，压缩保存到环形目录
+    'SNAPSHOT_ENABLED': True,
+    'SNAPSHOT_DIR': 'snapshots',
+    'SNAPSHOT_MAX_BYTES': 200 * 1024 * 1024,
+    'SNAPSHOT_QUEUE_SIZE': 20,
+    # 日志: 控制台简洁输出 + 轮转的 JSON 结构化日志文件
+    'LOG_LEVEL': logging.INFO,
+    'LOG_DIR': 'logs',
+    'LOG_FILE': 'import.jsonl',
+    'LOG_MAX_BYTES': 20 * 1024 * 1024,
+    'LOG_BACKUP_COUNT': 5,
+    # 自适应等待超时: 按历史步骤耗时的 p99 × 余量计算，并限制在上下限之间
+    'ADAPTIVE_TIMEOUTS': True,
+    'LATENCY_FILE': 'latency_stats.json',
+    'TIMEOUT_PERCENTILE': 0.99,
+    'TIMEOUT_MARGIN': 1.5,
+    'TIMEOUT_MIN': 3,
+    'TIMEOUT_MAX': 120,
+    'TIMEOUT_MIN_SAMPLES': 30,
+    # 分类调度: 按历史产出率（每分钟导入数）排序，并可限制整次运行的时间预算（秒，None 为不限）
+    'SCHEDULE_BY_YIELD': True,
+    'CATEGORY_HISTORY_FILE': 'category_stats.json',
+    'RUN_TIME_BUDGET': None,
+    # 没有历史记录的分类按该产出率排序，保证新分类也会被尝试
+    'YIELD_PRIOR_RATE': 1.0,
+    # 新一次运行的数据在历史平均值中所占的权重
+    'YIELD_HISTORY_WEIGHT': 0.5,
+    # 单个分类的上限（None 为不限）；时间上限未用完的部分顺延给下一个分类
+    'CATEGORY_MAX_IMPORTS': None,
+    'CATEGORY_MAX_DETAIL_PAGES': None,
+    'CATEGORY_MAX_SECONDS': None,
+    'CATEGORY_MAX_CONSECUTIVE_SKIPS': None,
+    # 搜索结果缓存: 按关键词（及页码、筛选条件）缓存卡片列表
+    'SEARCH_CACHE_ENABLED': True,
+    'SEARCH_CACHE_DIR': 'search_cache',
+    'SEARCH_CACHE_TTL': 6 * 3600,
+    'SEARCH_CACHE_MAX_BYTES': 50 * 1024 * 1024,
+    'SEARCH_CACHE_REFRESH': False,
+    # 搜索方式: browser 在浏览器中搜索并滚动 / http 直接请求搜索结果页（失败时回退到浏览器）
+    'SEARCH_BACKEND': 'browser',
+    'SEARCH_URL_TEMPLATE': 'https://www.alibaba.com/trade/search?SearchText={keyword}&page={page}',
+    'SEARCH_MAX_PAGES': 5,
+    'PRODUCT_URL_PATTERN': r'/product-detail/',
+    # HTTP 搜索使用的会话 Cookie（浏览器运行时自动保存）；安装 httpx 时复用连接池，有 h2 时启用 HTTP/2
+    'SESSION_COOKIE_FILE': 'session_cookies.json',
+    # 没有记录域名的 Cookie 只发给该域名及其子域名
+    'SESSION_COOKIE_DOMAIN': '.alibaba.com',
+    'HTTP_TIMEOUT': 15,
+    'HTTP_USER_AGENT': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                        '(KHTML, like Gecko) Chrome/124.0 Safari/537.36'),
+    # WebDriver 命令级性能分析（可选），退出时输出火焰图折叠栈文件和耗时排行
+    'PROFILE_ENABLED': False,
+    'PROFILE_FILE': 'profile.collapsed',
+    'PROFILE_TOP_N': 20,
+    # 浏览器对比测试: 用本地 HTML 样本比较各浏览器单个产品的耗时和内存
+    'BENCHMARK_BROWSERS': ('chrome', 'firefox'),
+    'BENCHMARK_FIXTURE_DIR': 'fixtures',
+    'BENCHMARK_ROUNDS': 3,
+    # 近似重复产品过滤: 标题 MinHash/LSH，可选缩略图感知哈希（需要 Pillow）
+    'DEDUP_ENABLED': True,
+    'DEDUP_INDEX_FILE': 'dedup_index.jsonl',
+    'DEDUP_TITLE_THRESHOLD': 0.8,
+    'DEDUP_NUM_PERM': 64,
+    # LSH 分段数（None 按相似度阈值自动选择，64 个槽位、阈值 0.8 时为 8 段 x 8 行）
+    'DEDUP_BANDS': None,
+    'DEDUP_IMAGE_HASH': False,
+    'DEDUP_IMAGE_MAX_DISTANCE': 6,
+    # dedup_benchmark 模式: 合成标题索引的规模和查询次数
+    'DEDUP_BENCHMARK_SIZE': 200000,
+    'DEDUP_BENCHMARK_QUERIES': 2000,
+    # 运行结果表: 每个产品一行，运行中持续写入 CSV，结束时转换为 xlsx（RESULTS_FORMAT 为 csv 时保留 CSV）
+    'RESULTS_ENABLED': True,
+    'RESULTS_DIR': 'results',
+    'RESULTS_FORMAT': 'xlsx',
+    'RESULTS_FLUSH_ROWS': 20,
+    'RESULTS_FLUSH_SECONDS': 30,
+    # 单个产品的总时限（秒，None 为不限），超时由看门狗线程停止页面加载并放弃该产品
+    'PRODUCT_DEADLINE': 150,
+    # 本地 Prometheus 指标端口（None 为不启动）
+    'METRICS_HOST': '127.0.0.1',
+    'METRICS_PORT': None,
+    # 选择器: 连续多次等待不到的选择器改用短超时尽快失败，每隔若干次仍按正常超时探测一次
+    'SELECTOR_STATS_FILE': 'selector_stats.json',
+    'SELECTOR_FAIL_FAST_AFTER': 3,
+    'SELECTOR_FAIL_FAST_TIMEOUT': 2,
+    'SELECTOR_PROBE_EVERY': 10,
+    # 熔断器: 某类失败连续达到阈值时暂停并做健康检查，能恢复则继续，否则停止运行
+    'BREAKER_THRESHOLDS': {'failed': 5, 'timed_out': 3, 'search_failed': 2},
+    'BREAKER_PAUSE': 30,
+    # BREAKER_TRIP_WINDOW 秒内熔断超过 BREAKER_MAX_TRIPS 次时，即使健康检查正常也停止运行
+    'BREAKER_MAX_TRIPS': 3,
+    'BREAKER_TRIP_WINDOW': 3600,
+    # 发现验证码或登录失效时等待人工在浏览器中处理的时间（秒，0 为不等待直接停止）
+    'BREAKER_MANUAL_WAIT': 300,
+    'BREAKER_PROBE_INTERVAL': 10,
+    # 健康检查: 打开 Importify 后台，跳转到登录页即视为登录失效
+    'IMPORTIFY_HEALTH_URL': 'https://app.importify.net/',
+    'LOGIN_URL_PATTERN': r'/(login|signin|sign_in|auth)\b',
+    'CAPTCHA_URL_PATTERN': r'punish|captcha|_____tmd_____',
+    # 重新登录钩子: 接收 driver 的函数，返回 True 表示已重新登录（None 为只等待人工登录）
+    'RELOGIN_HOOK': None
 }
 
+RUN_MODES = ('full', 'harvest', 'import', 'benchmark', 'dedup_benchmark')
+
+
+# 结构化日志字段，由 LogContextFilter 注入到每条日志记录
+LOG_FIELDS = ('category', 'product_id', 'step', 'duration', 'outcome')
+_log_context = threading.local()
+_log_listener = None
+
+
+class LogContextFilter(logging.Filter):
+    """把当前线程的日志上下文（分类、产品ID等）附加到日志记录上"""
+
+    def filter(self, record):
+        context = getattr(_log_context, 'fields', {})
+        for field in LOG_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record):
+        data = {
+            'time': record.created,
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        for field in LOG_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """控制台简洁格式，有步骤耗时时附加在行尾"""
+
+    def format(self, record):
+        line = super().format(record)
+        if getattr(record, 'step', None) and getattr(record, 'duration', None) is not None:
+            line += f" [{record.step} {record.duration:.2f}s {record.outcome or ''}]"
+        return line
+
+
+def setup_logging():
+    """日志写入队列，由后台 QueueListener 负责控制台和文件输出，主流程只需入队"""
+    global _log_listener
+    if _log_listener is not None:
+        return
+
+    os.makedirs(CONFIG['LOG_DIR'], exist_ok=True)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(ConsoleFormatter('%(asctime)s || %(message)s', '%H:%M:%S'))
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(CONFIG['LOG_DIR'], CONFIG['LOG_FILE']),
+        maxBytes=CONFIG['LOG_MAX_BYTES'],
+        backupCount=CONFIG['LOG_BACKUP_COUNT'],
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(LogContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(CONFIG['LOG_LEVEL'])
+
+    _log_listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """输出队列中剩余的日志并停止后台线程"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
+@contextmanager
+def log_context(**fields):
+    """在 with 块内为当前线程的所有日志附加字段"""
+    previous = getattr(_log_context, 'fields', {})
+    _log_context.fields = {**previous, **fields}
+    try:
+        yield
+    finally:
+        _log_context.fields = previous
+
+
+def note_timing(step, seconds):
+    """把步骤耗时记入当前产品（见 import_card），用于结果表"""
+    timings = getattr(_log_context, 'timings', None)
+    if timings is not None:
+        timings[step] = timings.get(step, 0.0) + seconds
+
+
+@contextmanager
+def timed_step(step):
+    """记录一个步骤的耗时和结果"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        logger.info(f"步骤失败: {step}", extra={
+            'step': step, 'duration': time.perf_counter() - start, 'outcome': 'error'})
+        note_timing(step, time.perf_counter() - start)
+        raise
+    logger.info(f"步骤完成: {step}", extra={
+        'step': step, 'duration': time.perf_counter() - start, 'outcome': 'ok'})
+    note_timing(step, time.perf_counter() - start)
+
+
+def extract_product_id(link):
+    """从阿里巴巴产品链接中提取产品ID"""
+    match = re.search(r'_(\d+)\.html', link or '')
+    return match.group(1) if match else None
+
+
+# Prometheus 指标: 计数器 {(名称, 标签): 值}，直方图 {(名称, 标签): [各分桶计数..., 总和, 次数]}
+METRICS_PREFIX = 'aliimport'
+METRICS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+METRICS_HELP = {
+    'products_total': ('counter', '按结果统计的产品数'),
+    'step_failures_total': ('counter', '按步骤统计的失败次数'),
+    'retries_total': ('counter', '重试次数'),
+    'detail_page_seconds': ('histogram', '详情页加载耗时'),
+    'import_seconds': ('histogram', 'Importify 导入耗时'),
+    'budget_dropped_total': ('counter', '按导入预算取消勾选的变体/图片数'),
+    'breaker_trips_total': ('counter', '按失败类型统计的熔断次数'),
+    'current_category': ('gauge', '正在处理的分类'),
+    'last_product_timestamp_seconds': ('gauge', '最近一个产品处理完成的时间'),
+}
+_metrics_counters = collections.defaultdict(float)
+_metrics_histograms = {}
+_metrics_gauges = {}
+_metrics_lock = threading.Lock()
+
+
+def metrics_inc(name, amount=1, **labels):
+    with _metrics_lock:
+        _metrics_counters[(name, tuple(sorted(labels.items())))] += amount
+
+
+def metrics_observe(name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    index = bisect.bisect_left(METRICS_BUCKETS, value)
+    with _metrics_lock:
+        histogram = _metrics_histograms.setdefault(key, [0] * (len(METRICS_BUCKETS) + 1) + [0.0, 0])
+        histogram[index] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+def metrics_set(name, value, **labels):
+    """设置仪表值；同名仪表只保留最新的一组标签"""
+    with _metrics_lock:
+        _metrics_gauges[name] = (tuple(sorted(labels.items())), value)
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = []
+    for key, value in items:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def render_metrics():
+    """按 Prometheus 文本格式输出全部指标"""
+    with _metrics_lock:
+        counters = dict(_metrics_counters)
+        histograms = {key: list(value) for key, value in _metrics_histograms.items()}
+        gauges = dict(_metrics_gauges)
+
+    lines = []
+    for name, (kind, help_text) in METRICS_HELP.items():
+        full_name = f'{METRICS_PREFIX}_{name}'
+        lines.append(f'# HELP {full_name} {help_text}')
+        lines.append(f'# TYPE {full_name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{full_name}{_format_labels(labels)} {float(value)!r}')
+        elif kind == 'gauge':
+            if name in gauges:
+                labels, value = gauges[name]
+                lines.append(f'{full_name}{_format_labels(labels)} {float(value)!r}')
+        else:
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(METRICS_BUCKETS + ('+Inf',), histogram):
+                    cumulative += count
+                    lines.append(f'{full_name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{full_name}_sum{_format_labels(labels)} {float(histogram[-2])!r}')
+                lines.append(f'{full_name}_count{_format_labels(labels)} {histogram[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """/metrics 返回 Prometheus 指标"""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server():
+    """在后台线程中启动本地指标服务"""
+    if CONFIG['METRICS_PORT'] is None:
+        return None
+    try:
+        server = http.server.ThreadingHTTPServer((CONFIG['METRICS_HOST'], CONFIG['METRICS_PORT']), MetricsHandler)
+    except OSError as e:
+        logger.error(f"启动指标服务失败: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"指标服务: http://{CONFIG['METRICS_HOST']}:{server.server_address[1]}/metrics")
+    return server
+
+
+# 失败快照后台写入队列与线程
+_snapshot_queue = None
+_snapshot_thread = None
+
+
+def start_snapshot_writer():
+    """启动后台快照写入线程（只启动一次）"""
+    global _snapshot_queue, _snapshot_thread
+    if _snapshot_thread is not None:
+        return
+    os.makedirs(CONFIG['SNAPSHOT_DIR'], exist_ok=True)
+    _snapshot_queue = queue.Queue(maxsize=CONFIG['SNAPSHOT_QUEUE_SIZE'])
+    _snapshot_thread = threading.Thread(target=_snapshot_writer_loop, name='snapshot-writer', daemon=True)
+    _snapshot_thread.start()
+    atexit.register(stop_snapshot_writer)
+
+
+def stop_snapshot_writer():
+    """写完队列中剩余的快照后停止后台线程"""
+    global _snapshot_thread
+    if _snapshot_thread is None:
+        return
+    _snapshot_queue.put(None)
+    _snapshot_thread.join(timeout=30)
+    _snapshot_thread = None
+
+
+def _snapshot_writer_loop():
+    while True:
+        snapshot = _snapshot_queue.get()
+        if snapshot is None:
+            break
+        try:
+            write_snapshot(snapshot)
+            trim_snapshot_dir()
+        except Exception as e:
+            logger.error(f"写入失败快照时出错: {e}")
+
+
+def write_snapshot(snapshot):
+    """把一次快照压缩写入单个 zip 文件"""
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(snapshot['time']))
+    step = re.sub(r'[^\w-]', '_', snapshot['step'])
+    name = f"{stamp}-{int(snapshot['time'] * 1000) % 1000:03d}-{step}.zip"
+    path = os.path.join(CONFIG['SNAPSHOT_DIR'], name)
+    tmp_path = path + '.tmp'
+    with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        if snapshot.get('screenshot'):
+            # PNG 本身已压缩，直接存储
+            zf.writestr('screenshot.png', base64.b64decode(snapshot['screenshot']), compress_type=zipfile.ZIP_STORED)
+        zf.writestr('panel.html', snapshot.get('html') or '')
+        zf.writestr('meta.json', json.dumps({
+            'time': snapshot['time'],
+            'step': snapshot['step'],
+            'url': snapshot.get('url'),
+            'error': snapshot.get('error'),
+        }, ensure_ascii=False, indent=2))
+    os.replace(tmp_path, path)
+
+
+def trim_snapshot_dir():
+    """按修改时间删除最旧的快照，使目录总大小不超过上限"""
+    directory = CONFIG['SNAPSHOT_DIR']
+    files = []
+    for name in os.listdir(directory):
+        if name.endswith('.zip'):
+            stat = os.stat(os.path.join(directory, name))
+            files.append((stat.st_mtime, stat.st_size, name))
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    while files and total > CONFIG['SNAPSHOT_MAX_BYTES']:
+        _, size, name = files.pop(0)
+        os.remove(os.path.join(directory, name))
+        total -= size
+
+
+def capture_failure_snapshot(driver, step, error=None):
+    """在失败处截取快照并交给后台线程写盘，主流程不等待磁盘和压缩"""
+    if not CONFIG['SNAPSHOT_ENABLED']:
+        return
+    try:
+        start_snapshot_writer()
+        if hasattr(driver, 'execute_cdp_cmd'):
+            screenshot = driver.execute_cdp_cmd('Page.captureScreenshot', {'format': 'png'}).get('data')
+        else:
+            screenshot = driver.get_screenshot_as_base64()
+        page = driver.execute_script("""
+            var panel = document.getElementById('importify-app-container');
+            return {url: location.href, html: panel ? panel.outerHTML : ''};
+        """) or {}
+        _snapshot_queue.put_nowait({
+            'time': time.time(),
+            'step': step,
+            'error': str(error) if error is not None else None,
+            'url': page.get('url'),
+            'html': page.get('html'),
+            'screenshot': screenshot,
+        })
+    except queue.Full:
+        logger.warning("快照队列已满，丢弃本次失败快照")
+    except Exception as e:
+        logger.warning(f"截取失败快照时出错: {e}")
+
+
+# 步骤耗时直方图: 对数分桶，上界从 0.05 秒按 1.25 倍递增到约 300 秒
+LATENCY_BUCKETS = [0.05 * 1.25 ** i for i in range(40)]
+# 单个步骤样本数超过该值时计数减半，让旧数据逐渐淡出
+LATENCY_MAX_SAMPLES = 5000
+_latency_stats = None
+_latency_lock = threading.Lock()
+
+
+def load_latency_stats():
+    """读取持久化的步骤耗时直方图（只读取一次）"""
+    global _latency_stats
+    if _latency_stats is not None:
+        return _latency_stats
+    _latency_stats = {}
+    try:
+        with open(CONFIG['LATENCY_FILE'], encoding='utf-8') as f:
+            data = json.load(f)
+        for step, counts in data.get('steps', {}).items():
+            if len(counts) == len(LATENCY_BUCKETS) + 1:
+                _latency_stats[step] = counts
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"读取步骤耗时统计失败: {e}")
+    atexit.register(save_latency_stats)
+    return _latency_stats
+
+
+def save_latency_stats():
+    """保存步骤耗时直方图，供下次运行使用"""
+    if _latency_stats is None:
+        return
+    try:
+        with _latency_lock:
+            data = json.dumps({'buckets': LATENCY_BUCKETS, 'steps': _latency_stats})
+        tmp_path = CONFIG['LATENCY_FILE'] + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, CONFIG['LATENCY_FILE'])
+    except Exception as e:
+        logger.warning(f"保存步骤耗时统计失败: {e}")
+
+
+# 对比测试等非生产运行期间不记录耗时和选择器统计，避免本地样本的耗时压低生产超时
+_stats_recording = {'enabled': True}
+
+
+@contextmanager
+def stats_paused():
+    """with 块内不记录等待耗时、选择器命中统计和后备定位切换"""
+    previous = _stats_recording['enabled']
+    _stats_recording['enabled'] = False
+    try:
+        yield
+    finally:
+        _stats_recording['enabled'] = previous
+
+
+def record_latency(step, seconds):
+    """把一次成功等待的耗时计入该步骤的直方图"""
+    if not _stats_recording['enabled']:
+        return
+    stats = load_latency_stats()
+    index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+    with _latency_lock:
+        counts = stats.setdefault(step, [0] * (len(LATENCY_BUCKETS) + 1))
+        counts[index] += 1
+        if sum(counts) > LATENCY_MAX_SAMPLES:
+            stats[step] = [c // 2 for c in counts]
+
+
+def latency_percentile(step, percentile):
+    """按直方图估算百分位耗时（取所在分桶的上界），样本不足时返回 None"""
+    counts = load_latency_stats().get(step)
+    if not counts:
+        return None
+    total = sum(counts)
+    if total < CONFIG['TIMEOUT_MIN_SAMPLES']:
+        return None
+    threshold = total * percentile
+    seen = 0
+    for index, count in enumerate(counts):
+        seen += count
+        if seen >= threshold:
+            return LATENCY_BUCKETS[min(index, len(LATENCY_BUCKETS) - 1)]
+    return LATENCY_BUCKETS[-1]
+
+
+def get_timeout(step, default):
+    """返回某个等待步骤的超时时间；关闭自适应或样本不足时使用固定值"""
+    if not CONFIG['ADAPTIVE_TIMEOUTS']:
+        return default
+    value = latency_percentile(step, CONFIG['TIMEOUT_PERCENTILE'])
+    if value is None:
+        return default
+    return min(max(value * CONFIG['TIMEOUT_MARGIN'], CONFIG['TIMEOUT_MIN']), CONFIG['TIMEOUT_MAX'])
+
+
+def wait_until(driver, step, condition, default_timeout=None, max_timeout=None):
+    """带自适应超时的显式等待，成功时记录耗时"""
+    if default_timeout is None:
+        default_timeout = CONFIG['WAIT_TIMEOUT']
+    timeout = get_timeout(step, default_timeout)
+    if max_timeout is not None:
+        timeout = min(timeout, max_timeout)
+    # 不等过产品总时限，到期后由 check_deadline 转为 ProductDeadlineExceeded
+    remaining = deadline_remaining()
+    if remaining is not None:
+        timeout = max(0, min(timeout, remaining))
+    start = time.perf_counter()
+    command_time = getattr(_profile_state, 'command_time', 0.0)
+
+    def guarded(d):
+        # 每次轮询前检查产品总时限，避免多层等待叠加超过时限
+        check_deadline()
+        return condition(d)
+
+    try:
+        result = WebDriverWait(driver, timeout).until(guarded)
+    except TimeoutException:
+        check_deadline()
+        raise
+    finally:
+        if CONFIG['PROFILE_ENABLED']:
+            # 只记录轮询间隔的等待时间，轮询期间的命令已单独计入
+            polled = getattr(_profile_state, 'command_time', 0.0) - command_time
+            _profile_record(f'wait:{step}', max(0.0, time.perf_counter() - start - polled))
+    record_latency(step, time.perf_counter() - start)
+    return result
+
+
+# 性能分析: (调用栈, 叶子) -> 累计秒数；叶子为 cmd:<命令> / sleep / wait:<步骤>
+_profile_samples = collections.defaultdict(float)
+_profile_lock = threading.Lock()
+_profile_state = threading.local()
+_MODULE_FILENAME = sys._getframe().f_code.co_filename
+# 不计入调用栈的内部函数
+_PROFILE_SKIP_FRAMES = {'pause', 'wait_until', '_profiled_execute', '_profile_record', '_caller_stack'}
+
+
+def _caller_stack():
+    """返回本文件内的调用栈（外层在前），只取函数名，开销很小"""
+    names = []
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename == _MODULE_FILENAME and code.co_name not in _PROFILE_SKIP_FRAMES \
+                and not code.co_name.startswith('<'):
+            names.append(code.co_name)
+        frame = frame.f_back
+    names.reverse()
+    return tuple(names)
+
+
+def _profile_record(leaf, seconds):
+    key = (_caller_stack(), leaf)
+    with _profile_lock:
+        _profile_samples[key] += seconds
+
+
+def install_profiler(driver):
+    """包装 driver 的命令执行器，统计每个 WebDriver 命令的耗时"""
+    if not CONFIG['PROFILE_ENABLED']:
+        return
+    executor = driver.command_executor
+    original_execute = executor.execute
+
+    def _profiled_execute(command, params):
+        start = time.perf_counter()
+        try:
+            return original_execute(command, params)
+        finally:
+            elapsed = time.perf_counter() - start
+            # 累计到当前线程，供 wait_until 扣除轮询中的命令耗时
+            _profile_state.command_time = getattr(_profile_state, 'command_time', 0.0) + elapsed
+            _profile_record(f'cmd:{command}', elapsed)
+
+    executor.execute = _profiled_execute
+    atexit.register(write_profile_report)
+    logger.info("已启用 WebDriver 命令性能分析")
+
+
+def pause(seconds):
+    """代替 time.sleep，启用性能分析时按调用位置记录等待时间；不会睡过产品总时限"""
+    remaining = deadline_remaining()
+    if remaining is not None:
+        seconds = max(0.0, min(seconds, remaining))
+    time.sleep(seconds)
+    if CONFIG['PROFILE_ENABLED']:
+        _profile_record('sleep', seconds)
+    check_deadline()
+
+
+class ProductDeadlineExceeded(BaseException):
+    """
+    产品处理超过总时限。继承 BaseException，使各处的 except Exception 不会吞掉它，
+    只有 handle_product_detail 处理并记录为 timed_out，沿途的 finally 仍会关闭标签页。
+    """
+
+
+# 看门狗状态: 当前产品的截止时间和驱动；只有主线程处理产品
+_watchdog = {'deadline': None, 'driver': None, 'fired': False}
+_watchdog_cond = threading.Condition()
+_watchdog_thread = None
+
+
+def _watchdog_loop():
+    with _watchdog_cond:
+        while True:
+            deadline = _watchdog['deadline']
+            if deadline is None or _watchdog['fired']:
+                _watchdog_cond.wait()
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                _watchdog_cond.wait(remaining)
+                continue
+
+            _watchdog['fired'] = True
+            driver = _watchdog['driver']
+            logger.warning(f"产品处理超过总时限（{CONFIG['PRODUCT_DEADLINE']}秒），停止页面加载")
+            # 主线程卡在轮询或等待之间时，这里可以直接停止页面；命令本身挂起时会排在其后执行
+            try:
+                if hasattr(driver, 'execute_cdp_cmd'):
+                    driver.execute_cdp_cmd('Page.stopLoading', {})
+                else:
+                    driver.execute_script('window.stop();')
+            except Exception as e:
+                logger.warning(f"停止页面加载失败: {e}")
+
+
+@contextmanager
+def product_deadline(driver):
+    """为 with 块内的单个产品设置总时限"""
+    global _watchdog_thread
+    limit = CONFIG['PRODUCT_DEADLINE']
+    if limit is None:
+        yield
+        return
+    with _watchdog_cond:
+        if _watchdog_thread is None:
+            _watchdog_thread = threading.Thread(target=_watchdog_loop, name='product-watchdog', daemon=True)
+            _watchdog_thread.start()
+        _watchdog.update(deadline=time.monotonic() + limit, driver=driver, fired=False)
+        _watchdog_cond.notify()
+    # 驱动端的页面加载和脚本超时也不超过时限，卡住的命令由浏览器自己结束，不依赖看门狗
+    original_timeouts = limit_driver_timeouts(driver, limit)
+    try:
+        yield
+    finally:
+        with _watchdog_cond:
+            _watchdog.update(deadline=None, driver=None, fired=False)
+            _watchdog_cond.notify()
+        if original_timeouts is not None:
+            try:
+                driver.timeouts = original_timeouts
+            except Exception as e:
+                logger.warning(f"恢复驱动超时设置失败: {e}")
+
+
+def limit_driver_timeouts(driver, limit):
+    """把页面加载和脚本超时降到不超过 limit 秒，返回原来的设置；驱动不支持时返回 None"""
+    try:
+        original = driver.timeouts
+        driver.set_page_load_timeout(min(original.page_load, limit))
+        driver.set_script_timeout(min(original.script, limit))
+        return original
+    except Exception as e:
+        logger.warning(f"设置驱动超时失败: {e}")
+        return None
+
+
+def deadline_remaining():
+    """当前产品剩余的秒数；未设置时限时返回 None"""
+    deadline = _watchdog['deadline']
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline():
+    """超过当前产品的总时限时抛出 ProductDeadlineExceeded"""
+    remaining = deadline_remaining()
+    if remaining is not None and remaining <= 0:
+        raise ProductDeadlineExceeded(f"超过产品总时限 {CONFIG['PRODUCT_DEADLINE']} 秒")
+
+
+def write_profile_report():
+    """输出火焰图折叠栈文件（单位微秒）和耗时排行"""
+    with _profile_lock:
+        samples = dict(_profile_samples)
+    if not samples:
+        return
+
+    try:
+        with open(CONFIG['PROFILE_FILE'], 'w', encoding='utf-8') as f:
+            for (stack, leaf), seconds in sorted(samples.items()):
+                frames = ';'.join(stack + (leaf,))
+                f.write(f"{frames} {int(seconds * 1_000_000)}\n")
+    except Exception as e:
+        logger.warning(f"写入性能分析文件失败: {e}")
+
+    by_leaf = collections.Counter()
+    by_site = collections.Counter()
+    for (stack, leaf), seconds in samples.items():
+        kind = leaf.split(':', 1)[0]
+        by_leaf[kind if kind != 'cmd' else leaf] += seconds
+        by_site[f"{stack[-1] if stack else '?'} -> {leaf}"] += seconds
+
+    total = sum(samples.values())
+    top_n = CONFIG['PROFILE_TOP_N']
+    logger.info(f"性能分析: 共记录 {total:.1f} 秒，折叠栈已写入 {CONFIG['PROFILE_FILE']}")
+    for name, seconds in by_leaf.most_common(top_n):
+        logger.info(f"  {seconds:9.2f}s {seconds / total:6.1%}  {name}")
+    logger.info("按调用位置:")
+    for name, seconds in by_site.most_common(top_n):
+        logger.info(f"  {seconds:9.2f}s {seconds / total:6.1%}  {name}")
+
+
+# 选择器注册表: 名称 -> 按优先级排列的 (By, 选择器)。优先使用 CSS，
+# 需要按文本匹配或 CSS 无法表达的才用 XPath；原有的精确 class 匹配 XPath 保留为后备。
+SELECTORS = {
+    'home_search_bar': [(By.CSS_SELECTOR, '.fy23-icbu-search-bar-inner')],
+    'captcha': [(By.CSS_SELECTOR, '#nocaptcha, .nc-container, #baxia-dialog-content, iframe[src*="punish"]')],
+    'importify_login': [(By.CSS_SELECTOR, 'form[action*="login"], input[type="password"]')],
+    'search_input': [(By.CSS_SELECTOR, 'input.search-bar-input.util-ellipsis'),
+                     (By.CSS_SELECTOR, 'input.search-bar-input')],
+    'search_button': [(By.CSS_SELECTOR, 'button.fy23-icbu-search-bar-inner-button')],
+    'search_results': [(By.CSS_SELECTOR, '.organic-list')],
+    'search_card': [(By.CSS_SELECTOR, '.fy23-search-card')],
+    'card_title': [(By.CSS_SELECTOR, '.search-card-e-title')],
+    'card_link': [(By.CSS_SELECTOR, 'a[href]'), (By.TAG_NAME, 'a')],
+    'card_image': [(By.CSS_SELECTOR, 'img')],
+    'detail_title': [(By.TAG_NAME, 'h1')],
+    'shipping_error': [(By.CSS_SELECTOR, 'div.unsafe-unableToShip'),
+                       (By.XPATH, '//div[@class="unsafe-unableToShip"]')],
+    'import_message': [(By.CSS_SELECTOR, 'div.textcontainer.centeralign.home-content > p:first-of-type'),
+                       (By.XPATH, '//div[@class="textcontainer centeralign home-content "]/p[1]')],
+    'import_container': [(By.ID, 'importify-app-container')],
+    'add_button': [(By.ID, 'addBtnCon')],
+    'draft_inactive': [(By.XPATH, '//span[@class="inactive" and text()="Draft"]'),
+                       (By.XPATH, '//span[contains(@class, "inactive") and normalize-space()="Draft"]')],
+    'draft_active': [(By.XPATH, '//span[text()="Draft" and not(contains(@class, "inactive"))]')],
+    'collection_button': [(By.CSS_SELECTOR, 'button.ms-choice')],
+    'collection_dropdown': [(By.CSS_SELECTOR, '.ms-drop')],
+    'collection_search': [(By.CSS_SELECTOR, '.ms-search input[type="text"]')],
+    'description_tab': [(By.ID, 'description_tab_button')],
+    'variants_tab': [(By.CSS_SELECTOR, 'button.accordion-tab[data-actab-group="0"][data-actab-id="2"]')],
+    'all_variants': [(By.ID, 'all_variants')],
+    'price_switch': [(By.ID, 'price_switch')],
+    'images_tab': [(By.CSS_SELECTOR, 'button.accordion-tab.accordion-custom-tab[data-actab-group="0"][data-actab-id="3"]'),
+                   (By.XPATH, '//button[@class="accordion-tab accordion-custom-tab" and @data-actab-group="0" '
+                              'and @data-actab-id="3"]')],
+    'add_to_store': [(By.ID, 'addBtnSec')],
+    # 导入预算用到的变体/图片列表，行内的复选框、价格、库存、图片地址用 CSS 在页面脚本中查找
+    'variant_rows': [(By.CSS_SELECTOR, '#variants_table tbody tr'),
+                     (By.CSS_SELECTOR, '.variants-table tbody tr')],
+    'variant_checkbox': [(By.CSS_SELECTOR, 'input[type="checkbox"]')],
+    'variant_price': [(By.CSS_SELECTOR, 'input[name*="price"]')],
+    'variant_stock': [(By.CSS_SELECTOR, 'input[name*="inventory"], input[name*="stock"]')],
+    'variant_image': [(By.CSS_SELECTOR, 'img')],
+    'image_items': [(By.CSS_SELECTOR, '#images_container .image-item'),
+                    (By.CSS_SELECTOR, '.product-images .image-item')],
+    'image_checkbox': [(By.CSS_SELECTOR, 'input[type="checkbox"]')],
+}
+
+# 每个选择器最近一次命中的定位方式下标，以及等待命中/未命中统计
+_selector_state = None
+_selector_lock = threading.Lock()
+
+
+def load_selector_state():
+    """读取上次运行保存的选择器统计（只读取一次）"""
+    global _selector_state
+    if _selector_state is not None:
+        return _selector_state
+    _selector_state = {'preferred': {}, 'stats': {}}
+    try:
+        with open(CONFIG['SELECTOR_STATS_FILE'], encoding='utf-8') as f:
+            data = json.load(f)
+        _selector_state['preferred'] = {name: index for name, index in data.get('preferred', {}).items()
+                                        if name in SELECTORS and index < len(SELECTORS[name])}
+        _selector_state['stats'] = {name: stats for name, stats in data.get('stats', {}).items() if name in SELECTORS}
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"读取选择器统计失败: {e}")
+    atexit.register(save_selector_state)
+    return _selector_state
+
+
+def save_selector_state():
+    """保存选择器统计，并列出有未命中记录的选择器"""
+    if _selector_state is None:
+        return
+    with _selector_lock:
+        data = json.dumps(_selector_state, ensure_ascii=False, indent=2)
+        stats = dict(_selector_state['stats'])
+    try:
+        with open(CONFIG['SELECTOR_STATS_FILE'], 'w', encoding='utf-8') as f:
+            f.write(data)
+    except Exception as e:
+        logger.warning(f"保存选择器统计失败: {e}")
+    for name, item in sorted(stats.items(), key=lambda kv: -kv[1]['misses']):
+        if item['misses']:
+            waits = item['hits'] + item['misses']
+            logger.info(f"选择器 {name}: 命中 {item['hits']}/{waits}，"
+                        f"平均等待 {item['seconds'] / waits:.2f}s，连续未命中 {item['consecutive_misses']}")
+
+
+def find_all(root, name):
+    """按注册表查找元素: 先试上次命中的定位方式，再依次尝试其余后备"""
+    variants = SELECTORS[name]
+    preferred = load_selector_state()['preferred']
+    first = preferred.get(name, 0)
+    for index in [first] + [i for i in range(len(variants)) if i != first]:
+        elements = root.find_elements(*variants[index])
+        if elements:
+            if index != first and _stats_recording['enabled']:
+                preferred[name] = index
+                logger.info(f"选择器 {name} 改用后备定位: {variants[index][1]}")
+            return elements
+    return []
+
+
+def css_selectors(name):
+    """注册表中某名称的全部 CSS 定位，供页面脚本使用"""
+    return [selector for by, selector in SELECTORS[name] if by == By.CSS_SELECTOR]
+
+
+def find_one(root, name):
+    elements = find_all(root, name)
+    return elements[0] if elements else None
+
+
+def selector_condition(name, state='present'):
+    """等待条件: present 存在 / visible 可见 / clickable 可见且可用，满足时返回元素"""
+    def condition(driver, *args):
+        for element in find_all(driver, name):
+            if state == 'present':
+                return element
+            if element.is_displayed() and (state == 'visible' or element.is_enabled()):
+                return element
+        return False
+    return condition
+
+
+def record_selector_result(name, hit, seconds):
+    if not _stats_recording['enabled']:
+        return
+    state = load_selector_state()
+    with _selector_lock:
+        stats = state['stats'].setdefault(name, {'hits': 0, 'misses': 0, 'seconds': 0.0, 'consecutive_misses': 0})
+        stats['seconds'] += seconds
+        if hit:
+            stats['hits'] += 1
+            stats['consecutive_misses'] = 0
+        else:
+            stats['misses'] += 1
+            stats['consecutive_misses'] += 1
+
+
+def selector_fail_fast(name):
+    """选择器连续多次未命中时返回短超时；每隔 SELECTOR_PROBE_EVERY 次仍按正常超时探测"""
+    stats = load_selector_state()['stats'].get(name)
+    if not stats:
+        return None
+    misses = stats['consecutive_misses']
+    if misses < CONFIG['SELECTOR_FAIL_FAST_AFTER'] or misses % CONFIG['SELECTOR_PROBE_EVERY'] == 0:
+        return None
+    return CONFIG['SELECTOR_FAIL_FAST_TIMEOUT']
+
+
+def wait_for(driver, name, state='present', default_timeout=None, step=None):
+    """等待注册表中的元素出现，记录命中统计；已知失效的选择器会很快超时"""
+    fail_fast = selector_fail_fast(name)
+    if fail_fast is not None:
+        logger.warning(f"选择器 {name} 已连续多次未命中，使用 {fail_fast} 秒短超时")
+    start = time.perf_counter()
+    try:
+        element = wait_until(driver, step or name, selector_condition(name, state), default_timeout, fail_fast)
+    except TimeoutException:
+        record_selector_result(name, False, time.perf_counter() - start)
+        raise
+    record_selector_result(name, True, time.perf_counter() - start)
+    return element
+
 
 # 优化浏览器选项设置
 def get_chrome_options():
@@ -40,26 +1048,464 @@ def get_chrome_options():
     options.add_argument(f'--user-data-dir={CONFIG["USER_DATA_DIR"]}')
     options.add_argument('--ignore-certificate-errors')
     options.add_argument('--log-level=3')
+    options.page_load_strategy = CONFIG['PAGE_LOAD_STRATEGY']
+    if CONFIG['IMPORT_DETECTION'] == 'network':
+        # 开启性能日志以便读取 CDP Network 事件
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    return options
+
+
+def launch_chrome():
+    service = Service(CONFIG['CHROME_DRIVER_PATH'])
+    return webdriver.Chrome(service=service, options=get_chrome_options())
+
+
+def block_resources_chrome(driver, patterns):
+    # CDP 命令只作用于当前标签页，新标签页需由 open_product_tab 重新设置
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(patterns)})
+
+
+def read_firefox_profile_path():
+    """读取保存的 Firefox 配置文件路径"""
+    try:
+        with open(CONFIG['FIREFOX_PROFILE_FILE'], encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def get_firefox_options():
+    options = FirefoxOptions()
+    if CONFIG['FIREFOX_BINARY_PATH']:
+        options.binary_location = CONFIG['FIREFOX_BINARY_PATH']
+    profile_path = read_firefox_profile_path()
+    if profile_path:
+        options.add_argument('-profile')
+        options.add_argument(profile_path)
+    options.accept_insecure_certs = True
+    options.page_load_strategy = CONFIG['PAGE_LOAD_STRATEGY']
     return options
 
 
+def launch_firefox():
+    if CONFIG['GECKODRIVER_PATH']:
+        service = FirefoxService(CONFIG['GECKODRIVER_PATH'])
+    else:
+        service = FirefoxService()
+    return webdriver.Firefox(service=service, options=get_firefox_options())
+
+
+def block_resources_firefox(driver, patterns):
+    # geckodriver 没有按 URL 屏蔽请求的接口
+    logger.warning("Firefox 不支持按 URL 屏蔽资源，已忽略 BLOCKED_URL_PATTERNS")
+
+
+# 浏览器后端: 启动方式和资源屏蔽；block_tab 为每个新标签页都要重新执行的屏蔽（None 表示不需要）
+BROWSER_BACKENDS = {
+    'chrome': {'launch': launch_chrome, 'options': get_chrome_options, 'block_resources': block_resources_chrome,
+               'block_tab': block_resources_chrome},
+    'firefox': {'launch': launch_firefox, 'options': get_firefox_options, 'block_resources': block_resources_firefox,
+                'block_tab': None},
+}
+
+
+def open_product_tab(driver, url):
+    """
+    在新标签页中打开 url 后切回原标签页。先打开空白页并设置资源屏蔽再导航，
+    使 BLOCKED_URL_PATTERNS 也作用于详情页；导航不等待页面加载，由调用方等待就绪条件。
+    """
+    backend = BROWSER_BACKENDS.get(driver.name, {})
+    if not CONFIG['BLOCKED_URL_PATTERNS'] or not backend.get('block_tab'):
+        driver.execute_script("window.open(arguments[0])", url)
+        return
+    original_window = driver.current_window_handle
+    existing = set(driver.window_handles)
+    driver.execute_script("window.open('about:blank')")
+    new_window = next(handle for handle in driver.window_handles if handle not in existing)
+    driver.switch_to.window(new_window)
+    try:
+        backend['block_tab'](driver, CONFIG['BLOCKED_URL_PATTERNS'])
+    except Exception as e:
+        logger.warning(f"新标签页设置资源屏蔽失败: {e}")
+    driver.execute_script("window.location.href = arguments[0]", url)
+    driver.switch_to.window(original_window)
+
+
 @contextmanager
-def open_browser():
+def open_browser(browser=None):
+    if browser is None:
+        browser = CONFIG['BROWSER']
+    backend = BROWSER_BACKENDS[browser]
     driver = None
     for attempt in range(1, CONFIG['MAX_RETRIES'] + 1):
         try:
-            service = Service(CONFIG['CHROME_DRIVER_PATH'])
-            driver = webdriver.Chrome(service=service, options=get_chrome_options())
-            logger.info("Chrome WebDriver启动成功。")
-            yield driver
-            return
+            driver = backend['launch']()
+            logger.info(f"{browser} WebDriver启动成功。")
+            install_profiler(driver)
+            if CONFIG['BLOCKED_URL_PATTERNS']:
+                backend['block_resources'](driver, CONFIG['BLOCKED_URL_PATTERNS'])
+            break
         except Exception as e:
             logger.error(f"启动WebDriver失败 (尝试 {attempt}/{CONFIG['MAX_RETRIES']}): {e}")
+            # 启动后设置失败时先关闭浏览器，否则它仍占用用户数据目录，之后的重试都会失败
+            if driver is not None:
+                try:
+                    driver.quit()
+                except Exception as quit_error:
+                    logger.warning(f"关闭启动失败的浏览器出错: {quit_error}")
+                driver = None
             if attempt == CONFIG['MAX_RETRIES']:
                 raise
+            metrics_inc('retries_total', operation='browser_launch')
             time.sleep(3)
-    if driver:
+    yield driver
+
+
+def restart_browser(driver, browser=None):
+    """
+    在同一个 WebDriver 对象上重启驱动和浏览器会话，调用方持有的 driver 引用保持有效。
+    命令执行器不变，已安装的性能分析包装无需重新安装。
+    """
+    if browser is None:
+        browser = CONFIG['BROWSER']
+    backend = BROWSER_BACKENDS[browser]
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.warning(f"关闭旧的浏览器会话失败: {e}")
+    driver.service.start()
+    driver.start_session(backend['options']().to_capabilities())
+    if CONFIG['BLOCKED_URL_PATTERNS']:
+        backend['block_resources'](driver, CONFIG['BLOCKED_URL_PATTERNS'])
+    metrics_inc('retries_total', operation='browser_restart')
+    logger.info(f"{browser} 浏览器已重启")
+
+
+def browser_rss(driver):
+    """浏览器进程树（驱动及其子进程）占用的物理内存，单位字节；没有 psutil 时返回 None"""
+    if psutil is None:
+        return None
+    try:
+        root = psutil.Process(driver.service.process.pid)
+        processes = [root] + root.children(recursive=True)
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    except Exception:
+        return None
+
+
+class QuietHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """不输出访问日志的静态文件处理器"""
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_directory(directory):
+    """在后台线程中用本地 HTTP 服务提供目录内容，产出基础 URL"""
+    handler = functools.partial(QuietHTTPRequestHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, name='fixture-server', daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def benchmark_browser(browser, base_url, fixtures):
+    """在一个浏览器中依次打开样本详情页，返回每个产品的耗时和内存峰值"""
+    latencies = []
+    peak_rss = None
+    with open_browser(browser) as driver:
+        driver.get(base_url + '/')
+        for _ in range(CONFIG['BENCHMARK_ROUNDS']):
+            for name in fixtures:
+                start = time.perf_counter()
+                open_product_tab(driver, f"{base_url}/{name}")
+                original_window = driver.current_window_handle
+                new_window = [h for h in driver.window_handles if h != original_window][0]
+                driver.switch_to.window(new_window)
+                try:
+                    wait_for_page_ready(driver, 'detail')
+                    check_shipping_error(driver)
+                    check_product_exists(driver)
+                finally:
+                    driver.close()
+                    driver.switch_to.window(original_window)
+                latencies.append(time.perf_counter() - start)
+
+                rss = browser_rss(driver)
+                if rss is not None:
+                    peak_rss = max(peak_rss or 0, rss)
         driver.quit()
+    return latencies, peak_rss
+
+
+def run_browser_benchmark():
+    """对比各浏览器后端处理本地样本详情页的单个产品耗时和内存"""
+    directory = CONFIG['BENCHMARK_FIXTURE_DIR']
+    fixtures = sorted(name for name in os.listdir(directory) if name.endswith('.html'))
+    if not fixtures:
+        logger.error(f"样本目录中没有 HTML 文件: {directory}")
+        return {}
+    if psutil is None:
+        logger.warning("未安装 psutil，不统计内存占用")
+
+    results = {}
+    with serve_directory(directory) as base_url, stats_paused():
+        for browser in CONFIG['BENCHMARK_BROWSERS']:
+            try:
+                latencies, peak_rss = benchmark_browser(browser, base_url, fixtures)
+            except Exception as e:
+                logger.error(f"浏览器 {browser} 测试失败: {e}")
+                continue
+            results[browser] = {
+                'mean': statistics.mean(latencies),
+                'p50': statistics.median(latencies),
+                'p95': statistics.quantiles(latencies, n=20)[18] if len(latencies) > 1 else latencies[0],
+                'peak_rss': peak_rss,
+            }
+
+    for browser, result in results.items():
+        rss_text = f"{result['peak_rss'] / 1024 / 1024:.0f} MB" if result['peak_rss'] else "未知"
+        logger.info(f"{browser}: 平均 {result['mean']:.2f}s, p50 {result['p50']:.2f}s, "
+                    f"p95 {result['p95']:.2f}s, 内存峰值 {rss_text}")
+    return results
+
+
+# 每个分类本次运行的产品结果计数
+CATEGORY_COUNTERS = collections.defaultdict(collections.Counter)
+
+
+def record_product_outcome(category, outcome):
+    """记录单个产品的处理结果: imported / skipped_unshippable / skipped_existing / skipped_duplicate / timed_out / failed"""
+    CATEGORY_COUNTERS[category][outcome] += 1
+    metrics_inc('products_total', outcome=outcome, category=category)
+    metrics_set('last_product_timestamp_seconds', time.time())
+    breaker_record(outcome)
+
+
+class RunAborted(BaseException):
+    """
+    运行环境异常且无法自动恢复，停止整个运行。与 ProductDeadlineExceeded 一样继承 BaseException，
+    不会被各层 except Exception 当作单个产品或分类的错误吞掉。
+    """
+
+
+# 熔断器状态: 每类失败的连续次数，tripped 为达到阈值的失败类型
+# trips 为最近各次熔断的时间
+_breaker = {'counts': collections.Counter(), 'tripped': None, 'trips': collections.deque()}
+
+
+# 能证明环境正常的结果及其清零的失败类型（None 为全部）。近似重复、无法发货等结果
+# 不经过导入流程，不能说明 Importify 仍可用，不清零计数。
+BREAKER_RESETS = {
+    'imported': None,
+    'skipped_existing': None,
+    'searched': ('search_failed',),
+    'harvested': ('search_failed',),
+}
+
+
+def breaker_record(outcome):
+    """记录一次结果: 失败类型累计连续次数，能证明对应环节正常的结果清零计数，其余结果不影响计数"""
+    thresholds = CONFIG['BREAKER_THRESHOLDS']
+    if outcome in BREAKER_RESETS:
+        kinds = BREAKER_RESETS[outcome]
+        if kinds is None:
+            _breaker['counts'].clear()
+        else:
+            for kind in kinds:
+                _breaker['counts'].pop(kind, None)
+        return
+    if outcome not in thresholds:
+        return
+    _breaker['counts'][outcome] += 1
+    if _breaker['tripped'] is None and _breaker['counts'][outcome] >= thresholds[outcome]:
+        _breaker['tripped'] = outcome
+
+
+def captcha_present(driver):
+    return bool(re.search(CONFIG['CAPTCHA_URL_PATTERN'], driver.current_url, re.IGNORECASE)
+                or find_all(driver, 'captcha'))
+
+
+def probe_health(driver):
+    """健康检查: 浏览器是否响应、Importify 是否仍登录、Alibaba 是否返回验证码。正常时返回 (None, None)"""
+    try:
+        driver.current_url
+    except Exception as e:
+        return 'browser_dead', f"浏览器无响应: {e}"
+
+    try:
+        if CONFIG['IMPORTIFY_HEALTH_URL']:
+            driver.get(CONFIG['IMPORTIFY_HEALTH_URL'])
+            if (re.search(CONFIG['LOGIN_URL_PATTERN'], driver.current_url, re.IGNORECASE)
+                    or find_all(driver, 'importify_login')):
+                return 'logged_out', "Importify 登录已失效"
+
+        driver.get("https://www.alibaba.com/")
+        if captcha_present(driver):
+            return 'captcha', "Alibaba 返回了验证码页面"
+        try:
+            wait_for_page_ready(driver, 'home')
+        except TimeoutException:
+            if captcha_present(driver):
+                return 'captcha', "Alibaba 返回了验证码页面"
+            return 'unreachable', "Alibaba 首页无法正常加载"
+    except TimeoutException as e:
+        return 'unreachable', f"健康检查页面加载超时: {e}"
+    except Exception as e:
+        return 'browser_dead', f"健康检查时浏览器出错: {e}"
+    return None, None
+
+
+def recover(driver, problem, detail):
+    """尝试从健康检查发现的问题中恢复，返回恢复后的 (问题类型, 说明)"""
+    if problem == 'browser_dead':
+        try:
+            restart_browser(driver)
+        except Exception as e:
+            return problem, f"{detail}，重启浏览器失败: {e}"
+        return probe_health(driver)
+
+    if problem == 'logged_out' and CONFIG['RELOGIN_HOOK']:
+        try:
+            if CONFIG['RELOGIN_HOOK'](driver):
+                return probe_health(driver)
+        except Exception as e:
+            logger.error(f"重新登录失败: {e}")
+
+    if problem in ('logged_out', 'captcha') and CONFIG['BREAKER_MANUAL_WAIT'] > 0:
+        action = "登录 Importify" if problem == 'logged_out' else "完成验证码"
+        logger.warning(f"请在浏览器窗口中{action}，最多等待 {CONFIG['BREAKER_MANUAL_WAIT']} 秒")
+        end = time.time() + CONFIG['BREAKER_MANUAL_WAIT']
+        while time.time() < end:
+            time.sleep(CONFIG['BREAKER_PROBE_INTERVAL'])
+            problem, detail = probe_health(driver)
+            if problem is None or problem == 'browser_dead':
+                break
+    return problem, detail
+
+
+def breaker_check(driver):
+    """
+    熔断器打开时暂停并检查运行环境: 正常或恢复后清零计数继续运行，
+    无法恢复或反复熔断时抛出 RunAborted 停止运行。
+    """
+    kind = _breaker['tripped']
+    if kind is None:
+        return
+    if driver is None:
+        raise RunAborted(f"连续 {_breaker['counts'][kind]} 次 {kind}，没有浏览器可做健康检查")
+    now = time.monotonic()
+    trips = _breaker['trips']
+    trips.append(now)
+    while trips and now - trips[0] > CONFIG['BREAKER_TRIP_WINDOW']:
+        trips.popleft()
+    metrics_inc('breaker_trips_total', kind=kind)
+    logger.warning(f"连续 {_breaker['counts'][kind]} 次 {kind}，熔断器打开，"
+                   f"暂停 {CONFIG['BREAKER_PAUSE']} 秒后检查运行环境")
+    time.sleep(CONFIG['BREAKER_PAUSE'])
+
+    problem, detail = probe_health(driver)
+    if problem is not None:
+        logger.warning(f"健康检查发现问题: {detail}")
+        if problem != 'browser_dead':
+            capture_failure_snapshot(driver, f'breaker_{problem}', detail)
+        problem, detail = recover(driver, problem, detail)
+    if problem is not None:
+        raise RunAborted(f"{detail}，无法自动恢复")
+    if len(trips) > CONFIG['BREAKER_MAX_TRIPS']:
+        raise RunAborted(f"熔断器 {CONFIG['BREAKER_TRIP_WINDOW']} 秒内已触发 {len(trips)} 次（最近一次: 连续 {kind}），"
+                         f"健康检查正常但产品仍持续失败")
+
+    logger.info("运行环境正常，继续处理")
+    _breaker['counts'].clear()
+    _breaker['tripped'] = None
+
+
+def load_category_history():
+    try:
+        with open(CONFIG['CATEGORY_HISTORY_FILE'], encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"读取分类历史统计失败: {e}")
+        return {}
+
+
+def save_category_history(history):
+    try:
+        tmp_path = CONFIG['CATEGORY_HISTORY_FILE'] + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(history, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, CONFIG['CATEGORY_HISTORY_FILE'])
+    except Exception as e:
+        logger.warning(f"保存分类历史统计失败: {e}")
+
+
+def update_category_history(history, category, counter, minutes):
+    """
+    把本次运行的结果按权重合并到分类历史平均值中。没有处理任何产品（如搜索失败）时不更新，
+    否则 0 导入会把分类压到最后，设置了运行时间预算时可能再也轮不到它。
+    """
+    cards = sum(counter.values())
+    if not cards:
+        logger.info(f"分类 '{category}' 本次没有处理任何产品，不更新历史统计")
+        return
+    # JSON 的键都是字符串，数字分类名也按字符串保存和查找
+    category = str(category)
+    skipped = counter['skipped_unshippable'] + counter['skipped_existing'] + counter['skipped_duplicate']
+    current = {
+        'imports': counter['imported'],
+        'minutes': minutes,
+        'cards': cards,
+        'skip_ratio': skipped / cards if cards else 0.0,
+    }
+    entry = history.get(category)
+    if entry is None:
+        entry = dict(current, runs=0)
+    else:
+        weight = CONFIG['YIELD_HISTORY_WEIGHT']
+        for key, value in current.items():
+            entry[key] = entry.get(key, value) * (1 - weight) + value * weight
+    entry['runs'] = entry.get('runs', 0) + 1
+    entry['last_run'] = time.time()
+    history[category] = entry
+
+
+def expected_yield(history, category):
+    """预计产出率（每分钟导入数）"""
+    entry = history.get(str(category))
+    if not entry or entry.get('minutes', 0) <= 0:
+        return CONFIG['YIELD_PRIOR_RATE']
+    return entry['imports'] / entry['minutes']
+
+
+def order_categories(categories, history):
+    """按预计产出率从高到低排列分类，产出率相同时保持表格顺序"""
+    if not CONFIG['SCHEDULE_BY_YIELD']:
+        return list(categories)
+    ordered = sorted(categories, key=lambda c: -expected_yield(history, c))
+    for category in ordered:
+        entry = history.get(str(category))
+        if entry:
+            logger.info(f"分类 '{category}' 预计产出 {expected_yield(history, category):.2f} 个/分钟，"
+                        f"跳过率 {entry.get('skip_ratio', 0):.0%}")
+        else:
+            logger.info(f"分类 '{category}' 无历史记录")
+    return ordered
 
 
 def open_alibaba(driver, selected_categories, sheet_names):
@@ -68,17 +1514,43 @@ def open_alibaba(driver, selected_categories, sheet_names):
             url = "https://www.alibaba.com/"
             logger.info(f"访问页面: {url}")
             driver.get(url)
-            search_bar = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CLASS_NAME, 'fy23-icbu-search-bar-inner'))
-            )
+            wait_for_page_ready(driver, 'home')
+            # 每次浏览器运行都保存会话 Cookie，供之后不开浏览器的 HTTP 搜索使用
+            save_session_cookies(driver)
+
+            history = load_category_history()
+            run_start = time.time()
+            budget = CONFIG['RUN_TIME_BUDGET']
 
             total_success_count = 0
-            for category in selected_categories:
+            carry_over = 0
+            for category in order_categories(selected_categories, history):
+                if budget is not None and time.time() - run_start >= budget:
+                    logger.info(f"已用完运行时间预算（{budget}秒），停止处理剩余分类")
+                    break
+
+                # 分类时间预算 = 固定上限 + 上一个分类剩余的时间，且不超过整次运行剩余的时间
+                time_budget = None
+                if CONFIG['CATEGORY_MAX_SECONDS'] is not None:
+                    time_budget = CONFIG['CATEGORY_MAX_SECONDS'] + carry_over
+                if budget is not None:
+                    remaining = budget - (time.time() - run_start)
+                    time_budget = remaining if time_budget is None else min(time_budget, remaining)
+
+                category_start = time.time()
                 try:
-                    success_count = process_link(driver, "https://www.alibaba.com/", category, sheet_names)
+                    success_count = process_link(driver, "https://www.alibaba.com/", category, sheet_names,
+                                                 time_budget)
                     total_success_count += success_count
                 except Exception as e:
                     logger.error(f"处理类别 '{category}' 出错: {e}")
+                finally:
+                    if CONFIG['CATEGORY_MAX_SECONDS'] is not None:
+                        carry_over = max(0, time_budget - (time.time() - category_start))
+
+                    update_category_history(history, category, CATEGORY_COUNTERS[category],
+                                            (time.time() - category_start) / 60)
+                    save_category_history(history)
 
             logger.info(f"总共成功导入的产品数量：{total_success_count}")
             driver.quit()
@@ -89,65 +1561,1001 @@ def open_alibaba(driver, selected_categories, sheet_names):
         logger.error(f"超时等待元素加载：{e}")
 
 
-def process_link(driver, link, category, sheet_name):
-    """处理单个链接的主要逻辑"""
-    success_count = 0
+def search_cache_key(keyword, page=1, filters=None):
+    """由关键词、页码和筛选条件计算缓存键"""
+    payload = json.dumps({
+        'keyword': str(keyword).strip().lower(),
+        'page': page,
+        'filters': filters or {},
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def read_search_cache(keyword, page=1, filters=None):
+    """读取未过期的缓存卡片列表；未命中时返回 None"""
+    if not CONFIG['SEARCH_CACHE_ENABLED'] or CONFIG['SEARCH_CACHE_REFRESH']:
+        return None
+    path = os.path.join(CONFIG['SEARCH_CACHE_DIR'], search_cache_key(keyword, page, filters) + '.json')
     try:
-        logger.info(f"处理分类: {category}")
-        logger.info(f"处理链接: {link}")
+        with open(path, encoding='utf-8') as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"读取搜索缓存失败: {e}")
+        return None
 
-        # 导航到链接并等待搜索框加载
-        driver.get(link)
-        search_input = WebDriverWait(driver, CONFIG['WAIT_TIMEOUT']).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, 'input.search-bar-input.util-ellipsis'))
-        )
+    if time.time() - entry.get('created', 0) > CONFIG['SEARCH_CACHE_TTL']:
+        return None
+    # 更新访问时间，淘汰时按最近最少使用的顺序删除
+    os.utime(path)
+    return entry.get('cards')
 
-        # 搜索产品
-        search_input.clear()
-        search_input.send_keys(category)
-        driver.find_element(By.CSS_SELECTOR, 'button.fy23-icbu-search-bar-inner-button').click()
 
-        # 等待产品列表加载
-        WebDriverWait(driver, CONFIG['WAIT_TIMEOUT_LONG']).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "organic-list"))
-        )
+def write_search_cache(keyword, cards, page=1, filters=None):
+    """写入缓存并在超过容量时淘汰最久未使用的条目"""
+    if not CONFIG['SEARCH_CACHE_ENABLED']:
+        return
+    directory = CONFIG['SEARCH_CACHE_DIR']
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, search_cache_key(keyword, page, filters) + '.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'keyword': str(keyword), 'page': page, 'filters': filters or {},
+                       'created': time.time(), 'cards': cards}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(directory, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        while files and total > CONFIG['SEARCH_CACHE_MAX_BYTES']:
+            _, size, name = files.pop(0)
+            os.remove(os.path.join(directory, name))
+            total -= size
+    except Exception as e:
+        logger.warning(f"写入搜索缓存失败: {e}")
+
+
+def search_category_cards(driver, link, category):
+    """在浏览器中搜索分类并滚动加载，返回全部卡片的标题和链接"""
+    # 导航到链接并等待搜索框加载
+    driver.get(link)
+    search_input = wait_for(driver, 'search_input')
+
+    # 搜索产品
+    search_input.clear()
+    search_input.send_keys(category)
+    wait_for(driver, 'search_button', 'clickable').click()
+
+    # 等待产品列表加载
+    wait_for(driver, 'search_results', default_timeout=CONFIG['WAIT_TIMEOUT_LONG'])
+
+    # 滚动加载所有产品
+    last_height = driver.execute_script("return document.body.scrollHeight")
+    while True:
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        pause(CONFIG['SCROLL_WAIT'])
+        new_height = driver.execute_script("return document.body.scrollHeight")
+        if new_height == last_height:
+            break
+        last_height = new_height
+
+    # 处理产品列表
+    product_list = find_all(driver, 'search_card')
+    logger.info(f"找到 {len(product_list)} 个产品")
+
+    cards = []
+    for product in product_list:
+        try:
+            # 获取产品标题和链接
+            title_element = find_one(product, 'card_title')
+            link_element = find_one(product, 'card_link')
+            if title_element is None or link_element is None:
+                raise NoSuchElementException("产品卡片缺少标题或链接")
+            title = title_element.text
+            href = link_element.get_attribute("href")
+            image_element = find_one(product, 'card_image')
+            image = image_element.get_attribute("src") if image_element else None
+        except Exception as e:
+            logger.error(f"读取产品卡片时出错: {e}")
+            continue
+        cards.append({'title': title, 'link': href, 'image': image})
+    return cards
 
-        # 滚动加载所有产品
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        while True:
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(CONFIG['SCROLL_WAIT'])
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                break
-            last_height = new_height
 
-        # 处理产品列表
-        product_list = driver.find_elements(By.CLASS_NAME, "fy23-search-card")
-        logger.info(f"找到 {len(product_list)} 个产品")
+class SearchBlocked(Exception):
+    """HTTP 搜索被拦截（验证码、非 200 响应）或页面中解析不到产品卡片"""
+
+
+def save_session_cookies(driver):
+    """保存浏览器当前的 Alibaba 会话 Cookie，供不打开浏览器的 HTTP 搜索使用"""
+    try:
+        cookies = [{'name': c['name'], 'value': c['value'], 'domain': c.get('domain')} for c in driver.get_cookies()]
+        with open(CONFIG['SESSION_COOKIE_FILE'], 'w', encoding='utf-8') as f:
+            json.dump(cookies, f, ensure_ascii=False)
+    except Exception as e:
+        logger.warning(f"保存会话 Cookie 失败: {e}")
+
+
+def load_session_cookies(driver=None):
+    """有浏览器时直接读取当前 Cookie，否则读取上次保存的文件"""
+    if driver is not None:
+        try:
+            cookies = driver.get_cookies()
+            if cookies:
+                return cookies
+        except Exception as e:
+            logger.warning(f"读取浏览器 Cookie 失败: {e}")
+    try:
+        with open(CONFIG['SESSION_COOKIE_FILE'], encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.warning("没有保存的会话 Cookie，HTTP 搜索将以未登录状态进行")
+    except Exception as e:
+        logger.warning(f"读取会话 Cookie 失败: {e}")
+    return []
+
+
+class SearchClient:
+    """
+    复用连接的 HTTP 客户端。安装了 httpx 时使用其连接池（有 h2 时启用 HTTP/2），
+    否则按主机保持 http.client 长连接。请求带上浏览器会话的 Cookie，并按 Cookie 的域名只发给匹配的主机
+    （以 . 开头的域名匹配该域名及子域名，否则只匹配同一主机）。
+    """
+
+    def __init__(self, cookies=None):
+        self.headers = {
+            'User-Agent': CONFIG['HTTP_USER_AGENT'],
+            'Accept': 'text/html,application/json;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.9',
+        }
+        # (域名, 名称) -> 值
+        self.cookies = {(c.get('domain') or CONFIG['SESSION_COOKIE_DOMAIN'], c['name']): c['value']
+                        for c in cookies or []}
+        self._client = None
+        self._connections = {}
+        if httpx is not None:
+            try:
+                self._client = self._httpx_client(http2=True)
+            except ImportError:
+                # 没有安装 h2 时 httpx 不支持 HTTP/2
+                self._client = self._httpx_client(http2=False)
+
+    def _httpx_client(self, http2):
+        cookies = httpx.Cookies()
+        for (domain, name), value in self.cookies.items():
+            cookies.set(name, value, domain=domain)
+        return httpx.Client(http2=http2, headers=self.headers, cookies=cookies,
+                            timeout=CONFIG['HTTP_TIMEOUT'], follow_redirects=True)
+
+    @staticmethod
+    def _domain_matches(host, domain):
+        if domain.startswith('.'):
+            return host == domain[1:] or host.endswith(domain)
+        return host == domain
+
+    def get(self, url):
+        """请求 URL，返回 (最终 URL, 状态码, Content-Type, 正文)"""
+        if self._client is not None:
+            response = self._client.get(url)
+            return str(response.url), response.status_code, response.headers.get('content-type', ''), response.text
+        return self._get_with_connection(url, redirects=5)
+
+    def _get_with_connection(self, url, redirects):
+        parts = urllib.parse.urlsplit(url)
+        connection = self._connections.get((parts.scheme, parts.netloc))
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(parts.netloc, timeout=CONFIG['HTTP_TIMEOUT'])
+            self._connections[(parts.scheme, parts.netloc)] = connection
+
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        headers = dict(self.headers)
+        host = (parts.hostname or '').lower()
+        cookie = '; '.join(f'{name}={value}' for (domain, name), value in self.cookies.items()
+                           if self._domain_matches(host, domain))
+        if cookie:
+            headers['Cookie'] = cookie
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # 服务器关闭了空闲的长连接，重新连接一次
+            connection.close()
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+        body = response.read()
+
+        for value in response.headers.get_all('Set-Cookie') or []:
+            pair, *attributes = value.split(';')
+            name, _, cookie_value = pair.partition('=')
+            domain = host
+            for attribute in attributes:
+                key, _, attribute_value = attribute.strip().partition('=')
+                if key.lower() == 'domain' and attribute_value:
+                    domain = '.' + attribute_value.strip().lstrip('.').lower()
+            # 忽略为其他域名设置的 Cookie
+            if self._domain_matches(host, domain):
+                self.cookies[(domain, name.strip())] = cookie_value.strip()
+        if response.status in (301, 302, 303, 307, 308) and redirects > 0 and response.headers.get('Location'):
+            return self._get_with_connection(urllib.parse.urljoin(url, response.headers['Location']), redirects - 1)
+
+        charset = response.headers.get_content_charset() or 'utf-8'
+        return url, response.status, response.headers.get('Content-Type', ''), body.decode(charset, 'replace')
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+
+
+_search_client = None
+
+
+def get_search_client(driver=None):
+    global _search_client
+    if _search_client is None:
+        _search_client = SearchClient(load_session_cookies(driver))
+        atexit.register(_search_client.close)
+    return _search_client
+
+
+def _css_class(name):
+    """注册表中形如 '.class' 的 CSS 选择器对应的 class 名"""
+    return next(selector[1:] for selector in css_selectors(name) if re.fullmatch(r'\.[\w-]+', selector))
+
+
+def _clean_title(title):
+    return ' '.join(html.unescape(re.sub(r'<[^>]+>', '', title)).split())
+
+
+class SearchCardParser(HTMLParser):
+    """按注册表中搜索卡片和标题的 class，从搜索结果 HTML 中提取标题、链接和首图"""
+
+    VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+
+    def __init__(self):
+        super().__init__()
+        self.card_class = _css_class('search_card')
+        self.title_class = _css_class('card_title')
+        self.cards = []
+        self.depth = 0
+        self.card_depth = None
+        self.title_depth = None
+        self.current = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if self.card_depth is None and self.card_class in classes:
+            self.card_depth = self.depth
+            self.current = {'title': '', 'link': None, 'image': None}
+        if self.current is not None:
+            if self.title_depth is None and self.title_class in classes:
+                self.title_depth = self.depth
+            if tag == 'a' and not self.current['link'] and attrs.get('href'):
+                self.current['link'] = attrs['href']
+            elif tag == 'img' and not self.current['image']:
+                self.current['image'] = attrs.get('src') or attrs.get('data-src')
+        if tag not in self.VOID_TAGS:
+            self.depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.VOID_TAGS:
+            return
+        self.depth -= 1
+        if self.title_depth is not None and self.depth <= self.title_depth:
+            self.title_depth = None
+        if self.card_depth is not None and self.depth <= self.card_depth:
+            if self.current['link']:
+                self.cards.append(self.current)
+            self.card_depth = None
+            self.current = None
+
+    def handle_data(self, data):
+        if self.title_depth is not None:
+            self.current['title'] += data
+
+
+def _walk_json_offers(data, cards):
+    """在搜索接口返回的 JSON 中查找同时带标题和详情页链接的对象"""
+    if isinstance(data, dict):
+        title = data.get('title') or data.get('subject')
+        link = data.get('productUrl') or data.get('detailUrl') or data.get('url')
+        if isinstance(title, str) and isinstance(link, str) and re.search(CONFIG['PRODUCT_URL_PATTERN'], link):
+            image = data.get('mainImage') or data.get('imageUrl') or data.get('image')
+            cards.append({'title': title, 'link': link, 'image': image if isinstance(image, str) else None})
+            return
+        data = list(data.values())
+    if isinstance(data, list):
+        for item in data:
+            _walk_json_offers(item, cards)
 
-        for product in product_list:
+
+def parse_search_page(text, base_url, content_type=''):
+    """解析搜索结果（JSON 接口或 HTML 页面），返回 {'title', 'link', 'image'} 列表，链接补全为绝对地址"""
+    cards = []
+    if 'json' in content_type or text.lstrip()[:1] in ('{', '['):
+        try:
+            _walk_json_offers(json.loads(text), cards)
+        except ValueError:
+            pass
+    if not cards:
+        parser = SearchCardParser()
+        parser.feed(text)
+        parser.close()
+        cards = parser.cards
+    for card in cards:
+        card['title'] = _clean_title(card['title'] or '')
+        card['link'] = urllib.parse.urljoin(base_url, card['link'])
+        if card['image']:
+            card['image'] = urllib.parse.urljoin(base_url, card['image'])
+    return cards
+
+
+def http_search_cards(client, category):
+    """不打开浏览器，逐页请求搜索结果并解析卡片，直到某页没有新产品或达到 SEARCH_MAX_PAGES"""
+    start = time.perf_counter()
+    cards = []
+    seen = set()
+    for page in range(1, CONFIG['SEARCH_MAX_PAGES'] + 1):
+        url = CONFIG['SEARCH_URL_TEMPLATE'].format(keyword=urllib.parse.quote_plus(str(category)), page=page)
+        page_start = time.perf_counter()
+        final_url, status, content_type, text = client.get(url)
+        if status != 200:
+            raise SearchBlocked(f"搜索结果页返回 HTTP {status}: {url}")
+        if re.search(CONFIG['CAPTCHA_URL_PATTERN'], final_url, re.IGNORECASE):
+            raise SearchBlocked(f"搜索请求被重定向到验证码页面: {final_url}")
+
+        page_cards = parse_search_page(text, final_url, content_type)
+        record_latency('http_search_page', time.perf_counter() - page_start)
+        if page == 1 and not page_cards:
+            raise SearchBlocked(f"搜索结果页中没有解析到产品卡片: {url}")
+
+        new_cards = []
+        for card in page_cards:
+            key = card['link'].split('?', 1)[0]
+            if key not in seen:
+                seen.add(key)
+                new_cards.append(card)
+        if not new_cards:
+            break
+        cards.extend(new_cards)
+
+    logger.info(f"HTTP 搜索 '{category}' 找到 {len(cards)} 个产品，耗时 {time.perf_counter() - start:.2f}秒")
+    return cards
+
+
+def iter_search_cards(driver, link, category, seen=None):
+    """搜索分类（优先使用缓存）并逐个产出去重后的产品卡片记录"""
+    if seen is None:
+        seen = set()
+
+    cards = read_search_cache(category)
+    if cards is not None:
+        logger.info(f"使用搜索缓存: {category}，共 {len(cards)} 个产品")
+    else:
+        if CONFIG['SEARCH_BACKEND'] == 'http':
             try:
-                # 获取产品标题和链接
-                title = product.find_element(By.CLASS_NAME, "search-card-e-title").text
-                link = product.find_element(By.TAG_NAME, "a").get_attribute("href")
-                logger.info(f"处理产品: {title}")
+                cards = http_search_cards(get_search_client(driver), category)
+            except Exception as e:
+                if driver is None:
+                    raise
+                logger.warning(f"HTTP 搜索失败，改用浏览器搜索: {e}")
+        if cards is None:
+            cards = search_category_cards(driver, link, category)
+        if cards:
+            write_search_cache(category, cards)
+
+    for card in cards:
+        href = card.get('link')
+        # 同一产品的链接只在查询参数上不同，按去掉参数后的地址去重
+        key = href.split('?', 1)[0] if href else None
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        yield {'category': category, 'title': card.get('title'), 'link': href, 'image': card.get('image')}
+
+
+# 近似重复索引: 标题 MinHash 签名按 LSH 分段建桶，缩略图 dHash 按 16 位分段建桶。
+# 签名以 32 位无符号整数数组保存，桶按分段各用一个 dict，只有一个产品时直接存键，减少内存占用。
+_dedup_index = None
+_dedup_lock = threading.Lock()
+# 空槽位借用相邻槽位最小值时加上的偏移量（乘以距离），避免与真实值相同
+_DENSIFY_OFFSET = 0x9E3779B1
+_SIGNATURE_MASK = 0xFFFFFFFF
+# 签名算法版本；索引文件中版本不同的条目在加载时按标题重新计算签名
+_SIGNATURE_VERSION = 2
+
+
+def title_shingles(title):
+    """标题规范化后取字符 3-gram"""
+    text = ' '.join(re.findall(r'\w+', (title or '').lower()))
+    if len(text) < 3:
+        return {text} if text else set()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def minhash_signature(title):
+    """
+    单次哈希的 MinHash（one permutation hashing）: 每个 3-gram 只哈希一次（CRC32 再乘黄金比例常数打散），
+    按哈希值高位分到 DEDUP_NUM_PERM 个槽位并取槽内最小值，空槽位从右侧最近的非空槽位借值
+    （rotation densification）。返回 32 位无符号整数数组 array('I')。
+    """
+    num_perm = CONFIG['DEDUP_NUM_PERM']
+    slots = [None] * num_perm
+    for shingle in title_shingles(title):
+        value = (zlib.crc32(shingle.encode('utf-8')) * 0x9E3779B1) & _SIGNATURE_MASK
+        slot = (value * num_perm) >> 32
+        if slots[slot] is None or value < slots[slot]:
+            slots[slot] = value
+    if all(value is None for value in slots):
+        return None
+
+    # 从右向左扫描两圈，每个槽位取右侧（循环）最近的非空槽位
+    signature = array.array('I', bytes(4 * num_perm))
+    nearest = None
+    for position in range(2 * num_perm - 1, -1, -1):
+        if slots[position % num_perm] is not None:
+            nearest = position
+        if position < num_perm:
+            signature[position] = (slots[nearest % num_perm]
+                                   + (nearest - position) * _DENSIFY_OFFSET) & _SIGNATURE_MASK
+    return signature
+
+
+def dedup_bands():
+    """
+    LSH 分段数: 未配置时在能整除槽位数的分段数中，选 S 曲线阈值 (1/b)^(1/r) 不高于且最接近
+    DEDUP_TITLE_THRESHOLD 的一个，使候选集中在阈值附近，而不是把大量低相似度产品拉进来逐个比较。
+    """
+    if CONFIG['DEDUP_BANDS']:
+        return CONFIG['DEDUP_BANDS']
+    num_perm = CONFIG['DEDUP_NUM_PERM']
+    threshold = CONFIG['DEDUP_TITLE_THRESHOLD']
+    # 分段越少阈值越高，取第一个不高于相似度阈值的分段数
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands == 0 and (1 / bands) ** (bands / num_perm) <= threshold:
+            return bands
+    return num_perm
+
+
+def _signature_bands(signature):
+    bands = dedup_bands()
+    data = signature.tobytes()
+    width = len(data) // bands
+    return [(band, hash(data[band * width:(band + 1) * width])) for band in range(bands)]
+
+
+def _bucket_add(buckets, band_key, key):
+    existing = buckets.get(band_key)
+    if existing is None:
+        buckets[band_key] = key
+    elif isinstance(existing, list):
+        existing.append(key)
+    else:
+        buckets[band_key] = [existing, key]
+
+
+def _bucket_get(buckets, band_key):
+    existing = buckets.get(band_key)
+    if existing is None:
+        return ()
+    return existing if isinstance(existing, list) else (existing,)
+
+
+def _image_bands(image_hash):
+    return [(band, (image_hash >> (band * 16)) & 0xFFFF) for band in range(4)]
+
+
+def image_dhash(url):
+    """下载缩略图并计算 64 位差值哈希；未安装 Pillow 或下载失败时返回 None"""
+    if Image is None or not url:
+        return None
+    if url.startswith('//'):
+        url = 'https:' + url
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            data = response.read()
+        image = Image.open(io.BytesIO(data)).convert('L').resize((9, 8))
+        pixels = list(image.getdata())
+        value = 0
+        for row in range(8):
+            for col in range(8):
+                value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+        return value
+    except Exception as e:
+        logger.debug(f"计算缩略图哈希失败: {e}")
+        return None
+
+
+def card_key(card):
+    return extract_product_id(card['link']) or card['link'].split('?', 1)[0]
+
+
+def _index_entry(key, signature, image_hash):
+    index = _dedup_index
+    if signature is not None:
+        index['signatures'][key] = signature
+        for band, band_key in _signature_bands(signature):
+            _bucket_add(index['buckets'][band], band_key, key)
+    if image_hash is not None:
+        index['image_hashes'][key] = image_hash
+        for band in _image_bands(image_hash):
+            _bucket_add(index['image_buckets'], band, key)
+
+
+def load_dedup_index():
+    """读取持久化的近似重复索引（只读取一次）"""
+    global _dedup_index
+    if _dedup_index is not None:
+        return _dedup_index
+    _dedup_index = {'signatures': {}, 'buckets': [{} for _ in range(dedup_bands())],
+                    'image_hashes': {}, 'image_buckets': {}, 'titles': {}}
+    try:
+        with open(CONFIG['DEDUP_INDEX_FILE'], encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                signature = entry.get('sig')
+                if signature is not None and len(signature) != CONFIG['DEDUP_NUM_PERM']:
+                    signature = None
+                if entry.get('v') != _SIGNATURE_VERSION:
+                    # 旧版本签名算法不同，按标题重新计算
+                    signature = minhash_signature(entry.get('title')) if signature else None
+                elif signature:
+                    signature = array.array('I', signature)
+                _index_entry(entry['key'], signature or None, entry.get('img'))
+                _dedup_index['titles'][entry['key']] = entry.get('title')
+        logger.info(f"已加载近似重复索引: {len(_dedup_index['titles'])} 个产品")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"读取近似重复索引失败: {e}")
+    return _dedup_index
+
+
+def find_near_duplicate(card):
+    """返回与卡片近似重复的已导入产品 (索引键, 标题)；没有时返回 None（标题可能为空，需用 is None 判断）"""
+    if not CONFIG['DEDUP_ENABLED']:
+        return None
+    index = load_dedup_index()
+    key = card_key(card)
+    if key in index['titles']:
+        return key, index['titles'][key]
+
+    signature = minhash_signature(card.get('title'))
+    card['_signature'] = signature
+    if signature is not None:
+        candidates = set()
+        for band, band_key in _signature_bands(signature):
+            candidates.update(_bucket_get(index['buckets'][band], band_key))
+        for candidate in candidates:
+            other = index['signatures'][candidate]
+            similarity = sum(map(operator.eq, signature, other)) / len(signature)
+            if similarity >= CONFIG['DEDUP_TITLE_THRESHOLD']:
+                return candidate, index['titles'].get(candidate)
+
+    if CONFIG['DEDUP_IMAGE_HASH']:
+        image_hash = image_dhash(card.get('image'))
+        card['_image_hash'] = image_hash
+        if image_hash is not None:
+            candidates = set()
+            for band in _image_bands(image_hash):
+                candidates.update(_bucket_get(index['image_buckets'], band))
+            for candidate in candidates:
+                distance = bin(image_hash ^ index['image_hashes'][candidate]).count('1')
+                if distance <= CONFIG['DEDUP_IMAGE_MAX_DISTANCE']:
+                    return candidate, index['titles'].get(candidate)
+    return None
+
+
+def add_to_dedup_index(card):
+    """把已导入（或已在店铺中）的产品加入索引并追加到索引文件"""
+    if not CONFIG['DEDUP_ENABLED']:
+        return
+    index = load_dedup_index()
+    key = card_key(card)
+    if key in index['titles']:
+        return
+    signature = card.get('_signature')
+    if signature is None:
+        signature = minhash_signature(card.get('title'))
+    image_hash = card.get('_image_hash')
+    with _dedup_lock:
+        _index_entry(key, signature, image_hash)
+        index['titles'][key] = card.get('title')
+        try:
+            with open(CONFIG['DEDUP_INDEX_FILE'], 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'key': key, 'title': card.get('title'), 'v': _SIGNATURE_VERSION,
+                                    'sig': signature.tolist() if signature is not None else None,
+                                    'img': image_hash}, ensure_ascii=False) + '\n')
+        except Exception as e:
+            logger.warning(f"写入近似重复索引失败: {e}")
+
+
+def dedup_index_bytes(index):
+    """估算索引本身占用的内存（签名、桶和键，不含标题字符串）"""
+    total = sys.getsizeof(index['signatures']) + sys.getsizeof(index['titles'])
+    for key, signature in index['signatures'].items():
+        total += sys.getsizeof(key) + sys.getsizeof(signature)
+    for buckets in index['buckets']:
+        total += sys.getsizeof(buckets)
+        for band_key, keys in buckets.items():
+            total += sys.getsizeof(band_key) + (sys.getsizeof(keys) if isinstance(keys, list) else 0)
+    return total
+
+
+def run_dedup_benchmark(size=None, queries=None):
+    """
+    用合成标题（同一细分品类的有限词表，模拟相似标题很多的情况）建立内存索引，
+    测量查询耗时和候选数量，不读写索引文件。
+    """
+    global _dedup_index
+    size = size or CONFIG['DEDUP_BENCHMARK_SIZE']
+    queries = queries or CONFIG['DEDUP_BENCHMARK_QUERIES']
+    rng = random.Random(42)
+    vocabulary = [f"{prefix}{suffix}" for prefix in
+                  ('steel', 'pedal', 'bin', 'trash', 'kitchen', 'lid', 'waste', 'round', 'square', 'plastic',
+                   'metal', 'office', 'hotel', 'home', 'outdoor', 'sensor', 'smart', 'recycle', 'garbage', 'can')
+                  for suffix in ('', 's', 'er', 'ed', 'ing', 'ly', '30l', '50l', 'pro', 'max', 'mini', 'eco', 'x')]
+    titles = [' '.join(rng.choice(vocabulary) for _ in range(rng.randint(8, 12))) for _ in range(size)]
+
+    saved_index = _dedup_index
+    _dedup_index = {'signatures': {}, 'buckets': [{} for _ in range(dedup_bands())],
+                    'image_hashes': {}, 'image_buckets': {}, 'titles': {}}
+    try:
+        build_start = time.perf_counter()
+        for number, title in enumerate(titles):
+            key = str(1600000000000 + number)
+            _index_entry(key, minhash_signature(title), None)
+            _dedup_index['titles'][key] = title
+        build_seconds = time.perf_counter() - build_start
+        index_bytes = dedup_index_bytes(_dedup_index)
+
+        latencies = []
+        candidates = []
+        hits = 0
+        for number in range(queries):
+            if number % 2:
+                # 近似重复: 已有标题末尾改一个词
+                words = rng.choice(titles).split()
+                words[-1] = rng.choice(vocabulary)
+                title = ' '.join(words)
+            else:
+                title = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(8, 12)))
+            card = {'link': f'https://www.alibaba.com/product-detail/q_{number}.html', 'title': title}
+            start = time.perf_counter()
+            hits += find_near_duplicate(card) is not None
+            latencies.append(time.perf_counter() - start)
+            signature = card['_signature']
+            candidates.append(len({key for band, band_key in _signature_bands(signature)
+                                   for key in _bucket_get(_dedup_index['buckets'][band], band_key)}))
+    finally:
+        _dedup_index = saved_index
+
+    latencies.sort()
+    result = {
+        'size': size,
+        'bands': dedup_bands(),
+        'build_seconds': build_seconds,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+        'median_candidates': sorted(candidates)[len(candidates) // 2],
+        'hit_rate': hits / queries,
+        'bytes_per_entry': index_bytes / size,
+    }
+    logger.info(f"近似重复索引 {size} 条（{result['bands']} 段）: 建立 {build_seconds:.1f}s，"
+                f"查询 p50 {result['p50_ms']:.3f}ms / p95 {result['p95_ms']:.3f}ms，"
+                f"候选数中位数 {result['median_candidates']}，命中率 {result['hit_rate']:.0%}，"
+                f"内存 {result['bytes_per_entry']:.0f} 字节/条")
+    return result
+
+
+# 运行结果表
+RESULT_COLUMNS = ('time', 'category', 'title', 'product_id', 'outcome', 'total_seconds',
+                  'steps_seconds', 'import_seconds', 'collection', 'link')
+_results = None
+
+
+def open_results():
+    """创建本次运行的结果 CSV 文件（只创建一次）"""
+    global _results
+    if _results is not None:
+        return _results
+    os.makedirs(CONFIG['RESULTS_DIR'], exist_ok=True)
+    path = os.path.join(CONFIG['RESULTS_DIR'], time.strftime('results-%Y%m%d-%H%M%S.csv'))
+    f = open(path, 'w', encoding='utf-8-sig', newline='')
+    writer = csv.writer(f)
+    writer.writerow(RESULT_COLUMNS)
+    _results = {'path': path, 'file': f, 'writer': writer, 'pending': 0, 'flushed_at': time.time()}
+    atexit.register(close_results)
+    logger.info(f"运行结果将写入: {path}")
+    return _results
+
+
+def write_result_row(card, product_id, outcome, total_seconds, timings, sheet_name):
+    """追加一行产品结果，按行数或时间间隔定期落盘"""
+    if not CONFIG['RESULTS_ENABLED']:
+        return
+    try:
+        results = open_results()
+        if isinstance(sheet_name, list):
+            sheet_name = sheet_name[0] if sheet_name else None
+        timings = timings or {}
+        results['writer'].writerow([
+            time.strftime('%Y-%m-%d %H:%M:%S'),
+            card.get('category'),
+            card.get('title'),
+            product_id,
+            outcome,
+            round(total_seconds, 2),
+            round(timings['steps'], 2) if 'steps' in timings else '',
+            round(timings['import_completion'], 2) if 'import_completion' in timings else '',
+            card.get('collection') or sheet_name,
+            card.get('link'),
+        ])
+        results['pending'] += 1
+        if (results['pending'] >= CONFIG['RESULTS_FLUSH_ROWS']
+                or time.time() - results['flushed_at'] >= CONFIG['RESULTS_FLUSH_SECONDS']):
+            results['file'].flush()
+            results['pending'] = 0
+            results['flushed_at'] = time.time()
+    except Exception as e:
+        logger.warning(f"写入运行结果失败: {e}")
 
-                # 在新标签页中打开产品
-                driver.execute_script(f"window.open('{link}')")
-                success_count = handle_product_detail(driver, category, success_count, sheet_name)
 
+def close_results():
+    """关闭结果 CSV；需要 xlsx 时用 openpyxl 的 write_only 模式逐行转换，内存占用不随行数增长"""
+    global _results
+    if _results is None:
+        return
+    results, _results = _results, None
+    results['file'].close()
+    if CONFIG['RESULTS_FORMAT'] != 'xlsx':
+        return
+
+    xlsx_path = os.path.splitext(results['path'])[0] + '.xlsx'
+    try:
+        wb = Workbook(write_only=True)
+        sheet = wb.create_sheet('results')
+        with open(results['path'], encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            sheet.append(next(reader))
+            for row in reader:
+                # 耗时列还原为数字单元格，其余（包括产品ID）保持文本
+                for index in range(5, 8):
+                    if row[index]:
+                        row[index] = float(row[index])
+                sheet.append(row)
+        wb.save(xlsx_path)
+        os.remove(results['path'])
+        logger.info(f"运行结果已保存: {xlsx_path}")
+    except Exception as e:
+        logger.error(f"生成结果表失败，保留 CSV 文件 {results['path']}: {e}")
+
+
+def import_card(driver, card, success_count, sheet_name):
+    """在新标签页中打开卡片链接并执行导入，返回 (成功数, 是否打开了详情页)"""
+    product_id = extract_product_id(card['link'])
+    with log_context(category=card['category'], product_id=product_id):
+        logger.info(f"处理产品: {card['title']}")
+        counter = CATEGORY_COUNTERS[card['category']]
+        before = collections.Counter(counter)
+        start = time.perf_counter()
+        _log_context.timings = {}
+        try:
+            # 与已导入产品近似重复时不打开详情页
+            duplicate = find_near_duplicate(card)
+            if duplicate is not None:
+                matched_key, matched_title = duplicate
+                logger.info(f"与已导入产品近似重复，跳过: {matched_title or matched_key}")
+                record_product_outcome(card['category'], 'skipped_duplicate')
+                return success_count, False
+
+            open_product_tab(driver, card['link'])
+            success_count = handle_product_detail(driver, card['category'], success_count, sheet_name)
+            if counter['imported'] + counter['skipped_existing'] > before['imported'] + before['skipped_existing']:
+                add_to_dedup_index(card)
+            return success_count, True
+        finally:
+            timings = _log_context.timings
+            _log_context.timings = None
+            outcome = next((key for key in counter if counter[key] > before[key]), 'failed')
+            write_result_row(card, product_id, outcome, time.perf_counter() - start, timings, sheet_name)
+
+
+def category_limit_reached(success_count, pages, elapsed, time_budget, consecutive_skips):
+    """检查分类是否达到任一上限，返回原因；未达到时返回 None"""
+    if CONFIG['CATEGORY_MAX_IMPORTS'] is not None and success_count >= CONFIG['CATEGORY_MAX_IMPORTS']:
+        return f"已导入 {success_count} 个产品"
+    if CONFIG['CATEGORY_MAX_DETAIL_PAGES'] is not None and pages >= CONFIG['CATEGORY_MAX_DETAIL_PAGES']:
+        return f"已打开 {pages} 个详情页"
+    if time_budget is not None and elapsed >= time_budget:
+        return f"已用时 {elapsed:.0f} 秒"
+    if (CONFIG['CATEGORY_MAX_CONSECUTIVE_SKIPS'] is not None
+            and consecutive_skips >= CONFIG['CATEGORY_MAX_CONSECUTIVE_SKIPS']):
+        return f"连续 {consecutive_skips} 个产品未导入"
+    return None
+
+
+def process_link(driver, link, category, sheet_name, time_budget=None):
+    """处理单个链接的主要逻辑"""
+    success_count = 0
+    start = time.time()
+    pages = 0
+    consecutive_skips = 0
+    try:
+        logger.info(f"处理分类: {category}")
+        logger.info(f"处理链接: {link}")
+        metrics_set('current_category', 1, category=category)
+        breaker_check(driver)
+
+        for number, card in enumerate(iter_search_cards(driver, link, category)):
+            if number == 0:
+                breaker_record('searched')
+            breaker_check(driver)
+            reason = category_limit_reached(success_count, pages, time.time() - start,
+                                            time_budget, consecutive_skips)
+            if reason:
+                logger.info(f"分类 '{category}' 达到上限（{reason}），提前结束")
+                break
+
+            previous_count = success_count
+            try:
+                success_count, opened = import_card(driver, card, success_count, sheet_name)
+                # 近似重复等未打开详情页的卡片不计入详情页上限
+                if opened:
+                    pages += 1
             except Exception as e:
+                # 出错时无法确定是否已打开详情页，按已打开计算
+                pages += 1
                 logger.error(f"处理单个产品时出错: {e}")
-                continue
+            consecutive_skips = 0 if success_count > previous_count else consecutive_skips + 1
 
         return success_count
 
     except Exception as e:
         logger.error(f"处理链接时出错: {e}")
+        breaker_record('search_failed')
         return success_count
 
 
+def harvest_categories(driver, selected_categories, sheet_name, file_path=None):
+    """只搜索不导入：把每个分类的去重卡片记录逐行写入 JSONL 文件"""
+    if file_path is None:
+        file_path = CONFIG['HARVEST_FILE']
+    if isinstance(sheet_name, list):
+        sheet_name = sheet_name[0] if sheet_name else None
+
+    if driver is not None:
+        # 与完整运行一样先打开首页并保存会话 Cookie，供之后不开浏览器的 HTTP 搜索使用
+        try:
+            driver.get("https://www.alibaba.com/")
+            wait_for_page_ready(driver, 'home')
+            save_session_cookies(driver)
+        except Exception as e:
+            logger.warning(f"打开首页保存会话 Cookie 失败: {e}")
+
+    seen = set()
+    total = 0
+    with open(file_path, 'a', encoding='utf-8') as f:
+        for category in selected_categories:
+            count = 0
+            breaker_check(driver)
+            try:
+                logger.info(f"采集分类: {category}")
+                for card in iter_search_cards(driver, "https://www.alibaba.com/", category, seen):
+                    card['collection'] = sheet_name
+                    card['harvested_at'] = time.time()
+                    f.write(json.dumps(card, ensure_ascii=False) + '\n')
+                    f.flush()
+                    count += 1
+                if count:
+                    breaker_record('harvested')
+            except Exception as e:
+                logger.error(f"采集类别 '{category}' 出错: {e}")
+                breaker_record('search_failed')
+            logger.info(f"分类 '{category}' 采集到 {count} 个产品")
+            total += count
+
+    logger.info(f"总共采集的产品数量：{total}，已写入 {file_path}")
+    return total
+
+
+def iter_harvest_file(file_path):
+    """逐行读取采集文件，惰性产出卡片记录"""
+    with open(file_path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                card = json.loads(line)
+            except ValueError as e:
+                logger.error(f"采集文件第 {line_no} 行格式错误: {e}")
+                continue
+            if card.get('link'):
+                yield card
+
+
+def import_harvest_file(driver, file_path=None, sheet_name=None):
+    """跳过搜索，直接导入采集文件中的产品"""
+    if file_path is None:
+        file_path = CONFIG['HARVEST_FILE']
+
+    success_count = 0
+    seen = set()
+    for card in iter_harvest_file(file_path):
+        key = card['link'].split('?', 1)[0]
+        if key in seen:
+            continue
+        seen.add(key)
+        breaker_check(driver)
+        try:
+            success_count, _ = import_card(driver, card, success_count, card.get('collection') or sheet_name)
+        except Exception as e:
+            logger.error(f"处理单个产品时出错: {e}")
+
+    logger.info(f"总共成功导入的产品数量：{success_count}")
+    return success_count
+
+
+# 各类页面的就绪条件:
+#   required - 必须出现的元素，依次等待
+#   any_of   - 任一出现即可开始操作（插件注入的按钮、无法发货提示、已存在提示），
+#              超时后回退为等待页面完全加载再检查一次
+PAGE_READY_GATES = {
+    'home': {
+        'required': ['home_search_bar'],
+        'any_of': [],
+    },
+    'detail': {
+        'required': ['detail_title'],
+        'any_of': ['add_button', 'shipping_error', 'import_message'],
+    },
+}
+
+
+def _any_present(names):
+    def condition(driver):
+        return any(find_all(driver, name) for name in names)
+    return condition
+
+
+def wait_for_page_ready(driver, page_type):
+    """按页面类型等待所需元素出现即返回，不等待其余资源加载完成"""
+    gate = PAGE_READY_GATES[page_type]
+    for name in gate['required']:
+        wait_for(driver, name, step=f'{page_type}_page')
+
+    if not gate['any_of']:
+        return
+    try:
+        wait_until(driver, f'{page_type}_gate', _any_present(gate['any_of']), CONFIG['READY_GATE_TIMEOUT'])
+        return
+    except TimeoutException:
+        logger.info("页面关键元素未出现，等待页面完全加载")
+
+    # 插件可能在页面 load 事件后才注入，回退到 normal 策略的等待方式
+    try:
+        wait_until(driver, f'{page_type}_load',
+                   lambda d: d.execute_script("return document.readyState") == 'complete',
+                   CONFIG['WAIT_TIMEOUT_LONG'])
+        wait_until(driver, f'{page_type}_gate_late', _any_present(gate['any_of']))
+    except TimeoutException:
+        logger.warning(f"页面 {page_type} 未出现插件按钮或提示信息，继续处理")
+
+
 def handle_product_detail(driver, category, success_count, sheet_name):
     """处理产品详情页面"""
     original_window = driver.current_window_handle
@@ -161,34 +2569,48 @@ def handle_product_detail(driver, category, success_count, sheet_name):
         # 切换到新窗口
         driver.switch_to.window(new_window)
 
-        try:
-            # 等待页面加载
-            WebDriverWait(driver, CONFIG['WAIT_TIMEOUT']).until(
-                EC.presence_of_element_located((By.TAG_NAME, "h1")))
-
-            # 检查产品是否可发货
-            if check_shipping_error(driver):
-                logger.info("产品无法发货到当前地区，跳过")
-                return success_count
-
-            # 检查产品是否已存在
-            if check_product_exists(driver):
-                logger.info("产品已存在，跳过")
-                return success_count
-
-            # 处理产品导入
-            success_count = process_product_import(driver, category, success_count, sheet_name)
-
-        finally:
-            # 确保关闭新窗口并切回原窗口
-            if new_window in driver.window_handles:
-                driver.close()
-                driver.switch_to.window(original_window)
+        with product_deadline(driver):
+            try:
+                # 等待页面加载
+                page_start = time.perf_counter()
+                wait_for_page_ready(driver, 'detail')
+                metrics_observe('detail_page_seconds', time.perf_counter() - page_start)
+
+                # 检查产品是否可发货
+                if check_shipping_error(driver):
+                    logger.info("产品无法发货到当前地区，跳过")
+                    record_product_outcome(category, 'skipped_unshippable')
+                    return success_count
+
+                # 检查产品是否已存在
+                if check_product_exists(driver):
+                    logger.info("产品已存在，跳过")
+                    record_product_outcome(category, 'skipped_existing')
+                    return success_count
+
+                # 处理产品导入
+                success_count = process_product_import(driver, category, success_count, sheet_name)
+
+            except (Exception, ProductDeadlineExceeded) as e:
+                # 关闭标签页前先保存失败现场
+                capture_failure_snapshot(driver, 'product_detail', e)
+                raise
+            finally:
+                # 确保关闭新窗口并切回原窗口
+                if new_window in driver.window_handles:
+                    driver.close()
+                    driver.switch_to.window(original_window)
 
         return success_count
 
+    except ProductDeadlineExceeded as e:
+        logger.error(f"产品处理超时，放弃: {e}")
+        record_product_outcome(category, 'timed_out')
+        ensure_main_window(driver, original_window)
+        return success_count
     except Exception as e:
         logger.error(f"处理产品详情页时发生错误: {e}")
+        record_product_outcome(category, 'failed')
         # 确保在发生错误时也能正确关闭窗口
         if new_window and new_window in driver.window_handles:
             driver.switch_to.window(new_window)
@@ -197,14 +2619,24 @@ def handle_product_detail(driver, category, success_count, sheet_name):
         return success_count
 
 
+def ensure_main_window(driver, main_window):
+    """关闭除主窗口外的所有标签页并切回主窗口"""
+    try:
+        for handle in driver.window_handles:
+            if handle != main_window:
+                driver.switch_to.window(handle)
+                driver.close()
+        driver.switch_to.window(main_window)
+    except Exception as e:
+        logger.error(f"切回主窗口时出错: {e}")
+
+
 def check_product_exists(driver):
     try:
-        message = driver.find_element(
-            By.XPATH,
-            '//div[@class="textcontainer centeralign home-content "]/p[1]'
-        ).text
-        return message == "This product is already in your store, what would you like to do?"
-    except NoSuchElementException:
+        message = find_one(driver, 'import_message')
+        return message is not None and \
+            message.text == "This product is already in your store, what would you like to do?"
+    except StaleElementReferenceException:
         return False
 
 
@@ -214,13 +2646,27 @@ def process_product_import(driver, category, success_count, sheet_name):
         perform_import_steps(driver, sheet_name)
 
         # 等待导入完成
-        if wait_for_import_completion(driver):
+        import_start = time.perf_counter()
+        with timed_step('import_completion'):
+            imported = wait_for_import_completion(driver)
+        metrics_observe('import_seconds', time.perf_counter() - import_start,
+                        result='imported' if imported else 'failed')
+        if imported:
             success_count += 1
             logger.info(f"产品导入成功，总数: {success_count}")
+            record_product_outcome(category, 'imported')
+        else:
+            metrics_inc('step_failures_total', step='import_completion')
+            record_product_outcome(category, 'failed')
 
+        return success_count
+    except ImportAborted as e:
+        logger.info(f"{e}，跳过")
+        record_product_outcome(category, e.outcome)
         return success_count
     except Exception as e:
         logger.error(f"产品导入过程中发生错误: {e}")
+        record_product_outcome(category, 'failed')
         return success_count
 
 
@@ -234,18 +2680,19 @@ def fetch_dropdown_options(driver, sheet_name):
         logger.info(f"输入关键词: {sheet_name}")
 
         # 等待下拉菜单的整个区域可见
-        dropdown = WebDriverWait(driver, CONFIG['WAIT_TIMEOUT']).until(
-            EC.visibility_of_element_located((By.CLASS_NAME, 'ms-drop')))
+        dropdown = wait_for(driver, 'collection_dropdown', 'visible')
         logger.info("找到下拉菜单区域")
 
         # 找到搜索框并输入关键词
-        search_box = dropdown.find_element(By.CSS_SELECTOR, '.ms-search input[type="text"]')
+        search_box = find_one(dropdown, 'collection_search')
+        if search_box is None:
+            raise NoSuchElementException("下拉菜单中没有搜索框")
         search_box.clear()
         search_box.send_keys(sheet_name.lower())
         logger.info(f"在搜索框中输入关键词: {sheet_name.lower()}")
 
         # 等待搜索结果加载完成
-        time.sleep(CONFIG['ANIMATION_WAIT'])
+        pause(CONFIG['ANIMATION_WAIT'])
 
         # 使用JavaScript取消所有复选框的选中状态
         driver.execute_script("""
@@ -278,156 +2725,22 @@ def fetch_dropdown_options(driver, sheet_name):
 
 
 def handle_product_actions(browser, category, success_count, sheet_name):
+    """旧版详情页导入入口，现与 perform_import_steps 共用同一个导入步骤图"""
     logger.info(f"处理产品详情页操作: {category}, {sheet_name}!!!")
     try:
-        add_btn_con = WebDriverWait(browser, 10).until(
-            EC.element_to_be_clickable((By.XPATH, '//*[@id="addBtnCon"]')))
-        add_btn_con.click()
-        logging.info("点击了按钮//*[@id='addBtnCon']")
-
-        try:
-            element = WebDriverWait(browser, 20).until(
-                EC.presence_of_element_located((By.XPATH, '//span[@class="inactive" and text()="Draft"]'))
-            )
-            logging.info("成功加载 Draft 元素")
-            actions = ActionChains(browser)
-            actions.move_to_element(element).perform()
-            element.click()
-            logging.info("成功点击 Draft 元素")
-            time.sleep(2)
-        except Exception as e:
-            logging.error(f"等待和点击 Draft 元素时出现错误：{e}")
-            close_current_tab(browser)
-            return success_count
-
-        time.sleep(3)  # 可以根据实际情况调整等待时间
-
-        # 等待 "Sorry, this product can't be shipped to your region." 元素出现
-        try:
-            WebDriverWait(browser, 10).until(
-                EC.presence_of_element_located(
-                    (By.XPATH, '//div[contains(text(), "Sorry, this product can\'t be shipped to your region.")]'))
-            )
-            logging.info("'检测到产品无法配送到当前区域，跳过'处理。")
-            browser.close()  # 关闭当前产品详情页标签页
-            return success_count  # 返回 success_count，继续处理下一款产品
-        except TimeoutException:
-            logging.info("未检测到区域限制消息，继续处理。")
-            pass  # 如果未找到消息元素，继续后续操作
-
-        # 检查是否出现 "This product is already in your store, what would you like to do?"
-        success_message = None
-        try:
-            success_message = browser.find_element(By.XPATH,
-                                                   '//div[@class="textcontainer centeralign home-content "]/p[1]')
-            if success_message.text == "This product is already in your store, what would you like to do?":
-                logging.info("产品已存在，不再处理当前产品")
-                browser.close()  # 关闭当前产品详情页标签页
-                return success_count  # 跳出函数，不再处理当前产品
-        except NoSuchElementException:
-            pass  # 如果未找到消息元素，继续后续操作
-
-        time.sleep(2)  # 可以根据实际情况调整等待时间
-
-        # 继续后续操作，例如选择下拉菜单中的类别等
-        select_button = WebDriverWait(browser, 10).until(
-            EC.element_to_be_clickable((By.XPATH, '//button[@class="ms-choice"]'))
-        )
-        logging.info("等待并点击选择按钮")
-        select_button.click()
-
-        dropdown = WebDriverWait(browser, 10).until(
-            EC.visibility_of_element_located((By.CLASS_NAME, "ms-drop"))
-        )
-
-        fetch_dropdown_options(browser, sheet_name)
-        time.sleep(3)
-
-        try:
-            # 点击 description_tab_button 按钮
-            description_tab_button = browser.find_element(By.XPATH, '//*[@id="description_tab_button"]')
-            description_tab_button.click()
-            logging.info("点击了 description_tab_button 按钮")
-            time.sleep(3)  # 等待页面加载
-
-            # 点击 Variants 按钮
-            variants_button = browser.find_element(By.CSS_SELECTOR,
-                                                   'button.accordion-tab[data-actab-group="0"][data-actab-id="2"]')
-            variants_button.click()
-            logging.info("点击了 Variants 按钮")
-
-            # 选择 Import all variants automatically 单选框
-            all_variants_radio = browser.find_element(By.ID, 'all_variants')
-            all_variants_radio.click()
-            logging.info("选择 Import all variants automatically 单选框")
-
-            time.sleep(3)  # 等待页面反应
-
-            # 选择 Select which variants to include 单选框
-            price_switch_radio = browser.find_element(By.ID, 'price_switch')
-            price_switch_radio.click()
-            logging.info("选择 Select which variants to include 单选框")
-
-            time.sleep(3)  # 等待页面反应
-        except Exception as e:
-            logging.error(f"点击 Variants 按钮时出现错误：{e}")
-            close_current_tab(browser)
-            return success_count
-
-        # 点击 Images 按钮
-        images_button = browser.find_element(By.XPATH,
-                                             '//button[@class="accordion-tab accordion-custom-tab" and @data-actab-group="0" and @data-actab-id="3"]')
-        images_button.click()
-        logging.info("点击了 Images 按钮")
-        time.sleep(3)  # 等待页面反应
-
-        add_to_store_button = browser.find_element(By.ID, 'addBtnSec')
-        scroll_to_element(browser, add_to_store_button)
-
-        add_to_store_button.click()
-        logging.info("成功点击 Add to your Store 按钮")
-
-        logging.info("等待页面加载完成")
-
-        # 等待导入过程完成，确保 importify-app-container 元素出现
-        try:
-            wait_for_element_to_appear(browser, By.ID, 'importify-app-container')
-            logging.info("产品正在导入中...")
-
-            # 等待成功消息出现
-            success_message = None
-            timeout = 100  # 设定超时时间
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                try:
-                    success_message = browser.find_element(By.XPATH,
-                                                           '//div[@class="textcontainer centeralign home-content "]/p[1]')
-                    if success_message.text == "We have successfully created the product page.":
-                        logging.info(f"产品导入成功, 共计: {success_count + 1}")
-                        success_count += 1
-                        break
-                    else:
-                        logging.warning("产品正在导入中...")
-                except Exception as e:
-                    logging.warning("未检测到产品成功导入，继续等待...")
-                time.sleep(5)  # 每秒检查一次
-
-            if not success_message or success_message.text != "We have successfully created the product page.":
-                logging.error("超时：未找到成功创建产品页面的消息")
-
-        except Exception as e:
-            logging.error(f"页面加载出错: {e}")
-            close_current_tab(browser)
-
-        time.sleep(3)
-        browser.close()
+        if check_shipping_error(browser):
+            logger.info("检测到产品无法配送到当前区域，跳过")
+            record_product_outcome(category, 'skipped_unshippable')
+        else:
+            success_count = process_product_import(browser, category, success_count, sheet_name)
+        close_current_tab(browser)
         return success_count
 
     except NoSuchWindowException as e:
-        logging.error(f"浏览器窗口丢失：{e}")
+        logger.error(f"浏览器窗口丢失：{e}")
         return success_count
     except Exception as e:
-        logging.error(f"处理产品详情页操作时发生错误: {e}")
+        logger.error(f"处理产品详情页操作时发生错误: {e}")
         return success_count
 
 
@@ -436,14 +2749,12 @@ def check_shipping_error(driver):
     检查产品详情页中是否有与无法发货相关的错误消息
     """
     try:
-        # 使用新的 XPath 查找包含错误消息的元素
-        error_message = driver.find_element(By.XPATH, '//div[@class="unsafe-unableToShip"]')
+        error_message = find_one(driver, 'shipping_error')
 
         # 检查元素是否显示在页面上
-        if error_message.is_displayed():
+        if error_message is not None and error_message.is_displayed():
             return True
-    except NoSuchElementException:
-        # 如果未找到元素，则返回 False
+    except StaleElementReferenceException:
         return False
 
     # 默认情况下返回 False
@@ -460,11 +2771,11 @@ def close_current_tab(browser):
         else:
             # 如果只有一个标签页，则关闭它
             browser.close()
-            logging.info("所有标签页已关闭，准备处理下一个产品")
+            logger.info("所有标签页已关闭，准备处理下一个产品")
     except NoSuchWindowException as e:
-        logging.error(f"浏览器窗口丢失：{e}")
+        logger.error(f"浏览器窗口丢失：{e}")
     except Exception as e:
-        logging.error(f"关闭标签页时发生错误: {e}")
+        logger.error(f"关闭标签页时发生错误: {e}")
 
 
 def wait_for_element_to_appear(driver, by, selector, timeout=10):
@@ -473,7 +2784,7 @@ def wait_for_element_to_appear(driver, by, selector, timeout=10):
             EC.presence_of_element_located((by, selector))
         )
     except TimeoutException:
-        logging.error(f"元素未能在 {timeout} 秒内出现: {selector}")
+        logger.error(f"元素未能在 {timeout} 秒内出现: {selector}")
         raise
 
 
@@ -538,7 +2849,7 @@ def scroll_to_element(driver, element):
     """优化的元素滚动函数"""
     try:
         # 使用显式等待确保元素可见
-        WebDriverWait(driver, CONFIG['WAIT_TIMEOUT']).until(EC.visibility_of(element))
+        wait_until(driver, 'scroll_visible', EC.visibility_of(element))
 
         # 使用平滑滚动
         driver.execute_script(
@@ -547,122 +2858,521 @@ def scroll_to_element(driver, element):
         )
 
         # 等待滚动动画完成
-        time.sleep(CONFIG['ANIMATION_WAIT'])
+        pause(CONFIG['ANIMATION_WAIT'])
 
         logger.info(f"滚动到元素: {element.text if hasattr(element, 'text') else '未知元素'}")
     except Exception as e:
         logger.error(f"滚动到元素时出错: {e}")
 
 
-def perform_import_steps(driver, sheet_name):
-    """执行产品导入的具体步骤，优化等待时间"""
-    try:
-        # 使用显式等待替代固定时间等待
-        wait = WebDriverWait(driver, CONFIG['WAIT_TIMEOUT'])
-        wait_long = WebDriverWait(driver, CONFIG['WAIT_TIMEOUT_LONG'])
-
-        # 点击添加按钮
-        add_btn = wait.until(
-            EC.element_to_be_clickable((By.XPATH, '//*[@id="addBtnCon"]')))
-        add_btn.click()
-        logger.info("点击了添加按钮")
-
-        # 点击 Draft - 使用长等待时间
-        draft_element = wait_long.until(
-            EC.element_to_be_clickable((By.XPATH, '//span[@class="inactive" and text()="Draft"]')))
-        ActionChains(driver).move_to_element(draft_element).click().perform()
-        logger.info("点击了 Draft 选项")
-
-        # 等待页面加载完成
-        wait.until(
-            EC.presence_of_element_located((By.XPATH, '//button[@class="ms-choice"]')))
-
-        # 选择类别
-        select_button = wait.until(
-            EC.element_to_be_clickable((By.XPATH, '//button[@class="ms-choice"]')))
-        select_button.click()
-        logger.info("打开类别选择下拉框")
-
-        # 处理下拉选项
-        fetch_dropdown_options(driver, sheet_name)
-        time.sleep(CONFIG['ANIMATION_WAIT'])  # 仅等待动画完成
-
-        # 使用自定义等待条件检查元素可交互
-        def element_is_ready(driver, xpath):
-            element = driver.find_element(By.XPATH, xpath)
-            return element.is_displayed() and element.is_enabled()
-
-        # 处理描述标签
-        wait.until(lambda d: element_is_ready(d, '//*[@id="description_tab_button"]'))
-        description_tab = driver.find_element(By.XPATH, '//*[@id="description_tab_button"]')
-        description_tab.click()
-        logger.info("点击了描述标签")
-
-        # 处理变体 - 使用显式等待替代固定等待
-        variants_button = wait.until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR,
-                                        'button.accordion-tab[data-actab-group="0"][data-actab-id="2"]')))
-        variants_button.click()
-        logger.info("点击了变体按钮")
-
-        # 选择变体选项
-        wait.until(EC.element_to_be_clickable((By.ID, 'all_variants'))).click()
-        time.sleep(CONFIG['ANIMATION_WAIT'])  # 等待动画完成
-
-        wait.until(EC.element_to_be_clickable((By.ID, 'price_switch'))).click()
-        time.sleep(CONFIG['ANIMATION_WAIT'])  # 等待动画完成
-
-        # 处理图片
-        images_button = wait.until(
-            EC.element_to_be_clickable((By.XPATH,
-                                        '//button[@class="accordion-tab accordion-custom-tab" and @data-actab-group="0" and @data-actab-id="3"]')))
-        images_button.click()
-        logger.info("点击了图片按钮")
-
-        # 点击添加到商店
-        add_to_store = wait.until(EC.element_to_be_clickable((By.ID, 'addBtnSec')))
-        scroll_to_element(driver, add_to_store)
-        add_to_store.click()
-        logger.info("点击了添加到商店按钮")
+class ImportAborted(Exception):
+    """导入步骤发现产品无需导入（如已在店铺中），outcome 为记录的结果类型"""
+
+    def __init__(self, reason, outcome='skipped_existing'):
+        super().__init__(reason)
+        self.outcome = outcome
+
+
+def _is_selected(name):
+    """条件: 单选框/复选框已选中"""
+    def condition(driver, context):
+        element = find_one(driver, name)
+        return element is not None and element.is_selected()
+    return condition
+
+
+def _collection_selected(driver, context):
+    """
+    条件: 下拉框中只选中了与工作表名称匹配的类别。Importify 中没有同名类别时与原流程一样
+    只记录警告并继续导入（视为已完成），不让每个产品都等到超时失败。
+    """
+    status = driver.execute_script("""
+        var searchTerm = arguments[0].toLowerCase();
+        var boxes = Array.prototype.slice.call(document.querySelectorAll('input[data-name="selectItem"]'));
+        var matching = boxes.filter(function(c) {
+            return c.nextElementSibling && c.nextElementSibling.innerText.toLowerCase() === searchTerm;
+        });
+        if (!matching.length) return boxes.length ? 'no_match' : 'empty';
+        var checked = boxes.filter(function(c) { return c.checked; });
+        return checked.length === 1 && matching.indexOf(checked[0]) >= 0 ? 'selected' : 'pending';
+    """, str(context['sheet_name']))
+    if status == 'selected':
+        return True
+    # 选项列表为空时可能尚未渲染，打开下拉框之后仍为空才放弃选择
+    if status == 'no_match' or (status == 'empty' and context.get('collection_opened')):
+        if not context.get('collection_warned'):
+            logger.warning(f"Importify 中没有名为 '{context['sheet_name']}' 的类别，不设置类别继续导入")
+            context['collection_warned'] = True
+        return True
+    return False
+
+
+def _already_in_store(driver, context):
+    if check_product_exists(driver):
+        return "产品已存在"
+    return None
+
+
+def _click(driver, context, element):
+    element.click()
+
 
+def _click_draft(driver, context, element):
+    ActionChains(driver).move_to_element(element).click().perform()
+
+
+def _select_collection(driver, context, element):
+    context['collection_opened'] = True
+    element.click()
+    fetch_dropdown_options(driver, context['sheet_name'])
+
+
+# 在页面中按预算取消勾选多余的变体/图片。通过 click() 取消勾选以触发 Importify 自己的事件处理；
+# 保留规则为 cheapest/stock 时按行内输入框数值排序，image 规则 variant 优先保留已保留变体的图片。
+# 返回 [总数, 已勾选数, 本次取消勾选数]；dryRun 为真时只统计不修改。
+_BUDGET_SCRIPT = """
+var rowSelectors = arguments[0], checkboxSelector = arguments[1], limit = arguments[2],
+    rule = arguments[3], ruleSelector = arguments[4], preferredSrcs = arguments[5] || [],
+    srcSelector = arguments[6], dryRun = arguments[7];
+var rows = [];
+for (var i = 0; i < rowSelectors.length && !rows.length; i++) {
+    rows = Array.prototype.slice.call(document.querySelectorAll(rowSelectors[i]));
+}
+var items = [];
+rows.forEach(function(row, index) {
+    var box = row.querySelector(checkboxSelector);
+    if (!box) return;
+    var key = index;
+    if (rule === 'cheapest' || rule === 'stock') {
+        var input = row.querySelector(ruleSelector);
+        var value = input ? parseFloat(input.value || input.textContent) : NaN;
+        if (isNaN(value)) value = rule === 'cheapest' ? Infinity : -Infinity;
+        key = rule === 'cheapest' ? value : -value;
+    } else if (rule === 'variant') {
+        var img = row.querySelector(srcSelector) || row;
+        key = preferredSrcs.indexOf(img.getAttribute('src') || img.getAttribute('data-src')) >= 0 ? -1 : index;
+    }
+    items.push({box: box, row: row, key: key, index: index});
+});
+var checked = items.filter(function(item) { return item.box.checked; });
+checked.sort(function(a, b) { return a.key - b.key || a.index - b.index; });
+var dropped = 0;
+if (!dryRun && limit > 0) {
+    checked.slice(limit).forEach(function(item) { item.box.click(); dropped++; });
+}
+var kept = checked.slice(0, limit > 0 ? limit : checked.length);
+var srcs = kept.map(function(item) {
+    var img = item.row.querySelector(srcSelector);
+    return img ? (img.getAttribute('src') || img.getAttribute('data-src')) : null;
+}).filter(Boolean);
+return [items.length, checked.length - dropped, dropped, srcs];
+"""
+
+
+def _run_budget(driver, context, kind, dry_run=False):
+    if kind == 'variants':
+        rule = CONFIG['VARIANT_KEEP_RULE']
+        rule_name = {'cheapest': 'variant_price', 'stock': 'variant_stock'}.get(rule, 'variant_price')
+        args = (css_selectors('variant_rows'), css_selectors('variant_checkbox')[0], CONFIG['MAX_VARIANTS'],
+                rule, css_selectors(rule_name)[0], [], css_selectors('variant_image')[0], dry_run)
+    else:
+        rule = CONFIG['IMAGE_KEEP_RULE']
+        args = (css_selectors('image_items'), css_selectors('image_checkbox')[0], CONFIG['MAX_IMAGES'],
+                rule, '', context.get('variant_images', []), 'img', dry_run)
+    total, selected, dropped, srcs = driver.execute_script(_BUDGET_SCRIPT, *args)
+    if kind == 'variants':
+        context['variant_images'] = srcs
+    return total, selected, dropped
+
+
+def _within_budget(kind, config_key):
+    """条件: 已勾选的变体/图片数量不超过预算"""
+    def condition(driver, context):
+        limit = CONFIG[config_key]
+        if limit <= 0:
+            return True
+        total, selected, dropped = _run_budget(driver, context, kind, dry_run=True)
+        return selected <= limit
+    return condition
+
+
+def _apply_budget(kind):
+    def action(driver, context, element):
+        total, selected, dropped = _run_budget(driver, context, kind)
+        if dropped:
+            metrics_inc('budget_dropped_total', dropped, kind=kind)
+            logger.info(f"导入预算: {kind} 共 {total} 个，取消勾选 {dropped} 个，保留 {selected} 个")
+    return action
+
+
+def _add_to_store(driver, context, element):
+    scroll_to_element(driver, element)
+    drain_performance_log(driver)
+    element.click()
+
+
+# 导入步骤图，按声明顺序轮询:
+#   after  - 依赖的步骤，全部完成或跳过后才开始检查本步骤
+#   done   - 已满足则直接跳过；执行动作后也等待它成立（None 表示总是执行且不等待）
+#   ready  - 选择器注册表中的名称，元素可见且可用时执行 action(driver, context, element)
+#   abort  - 执行动作后检查，返回原因时放弃导入该产品
+#   timeout - 等待 ready 的默认超时配置项（自适应超时开启时按历史耗时调整）
+IMPORT_STEPS = [
+    {
+        'name': 'add_button',
+        'after': (),
+        'done': selector_condition('collection_button', 'visible'),
+        'ready': 'add_button',
+        'action': _click,
+        'abort': _already_in_store,
+        'timeout': 'WAIT_TIMEOUT',
+    },
+    {
+        'name': 'draft',
+        'after': ('add_button',),
+        'done': selector_condition('draft_active'),
+        'ready': 'draft_inactive',
+        'action': _click_draft,
+        'timeout': 'WAIT_TIMEOUT_LONG',
+    },
+    {
+        'name': 'collection',
+        'after': ('add_button',),
+        'done': _collection_selected,
+        'ready': 'collection_button',
+        'action': _select_collection,
+        'timeout': 'WAIT_TIMEOUT',
+    },
+    {
+        'name': 'description',
+        'after': ('add_button',),
+        'done': None,
+        'ready': 'description_tab',
+        'action': _click,
+        'timeout': 'WAIT_TIMEOUT',
+    },
+    {
+        'name': 'variants_tab',
+        'after': ('description',),
+        'done': selector_condition('all_variants', 'clickable'),
+        'ready': 'variants_tab',
+        'action': _click,
+        'timeout': 'WAIT_TIMEOUT',
+    },
+    {
+        'name': 'all_variants',
+        'after': ('variants_tab',),
+        'done': lambda d, c: _is_selected('all_variants')(d, c) or _is_selected('price_switch')(d, c),
+        'ready': 'all_variants',
+        'action': _click,
+        'timeout': 'WAIT_TIMEOUT',
+    },
+    {
+        'name': 'price_switch',
+        'after': ('all_variants',),
+        'done': _is_selected('price_switch'),
+        'ready': 'price_switch',
+        'action': _click,
+        'timeout': 'WAIT_TIMEOUT',
+    },
+    {
+        'name': 'images_tab',
+        # 图片和变体在同一个折叠组中，变体预算处理完再切换到图片，避免变体行被收起
+        'after': ('variant_budget',),
+        'done': None,
+        'ready': 'images_tab',
+        'action': _click,
+        'timeout': 'WAIT_TIMEOUT',
+    },
+    {
+        'name': 'variant_budget',
+        'after': ('price_switch',),
+        'done': _within_budget('variants', 'MAX_VARIANTS'),
+        'ready': 'variant_rows',
+        'action': _apply_budget('variants'),
+        'timeout': 'WAIT_TIMEOUT',
+    },
+    {
+        'name': 'image_budget',
+        'after': ('images_tab', 'variant_budget'),
+        'done': _within_budget('images', 'MAX_IMAGES'),
+        'ready': 'image_items',
+        'action': _apply_budget('images'),
+        'timeout': 'WAIT_TIMEOUT',
+    },
+    {
+        'name': 'add_to_store',
+        'after': ('draft', 'collection', 'variant_budget', 'image_budget'),
+        'done': None,
+        'ready': 'add_to_store',
+        'action': _add_to_store,
+        'timeout': 'WAIT_TIMEOUT',
+    },
+]
+
+# 步骤图轮询间隔（秒）
+STEP_POLL_INTERVAL = 0.1
+
+
+def _check(condition, driver, context):
+    """执行条件函数，页面元素变化导致的异常视为条件不成立"""
+    try:
+        return condition(driver, context)
+    except (NoSuchElementException, StaleElementReferenceException):
+        return None
+
+
+def _step_settled(step, driver, context):
+    """动作执行后的等待条件: 放弃条件成立时返回原因，done 成立（或没有 done）时返回 True"""
+    if step.get('abort'):
+        reason = _check(step['abort'], driver, context)
+        if reason:
+            return reason
+    if not step['done'] or _check(step['done'], driver, context):
+        return True
+    return False
+
+
+def run_import_steps(driver, steps, context):
+    """
+    执行导入步骤图: 已满足的步骤直接跳过，其余步骤只等待条件成立，
+    互不依赖的步骤谁先就绪谁先执行。返回每个步骤的耗时 {name: (outcome, seconds)}。
+    """
+    results = {}
+    eligible_since = {}
+    pending = list(steps)
+
+    while pending:
+        progressed = False
+        now = time.perf_counter()
+        for step in list(pending):
+            name = step['name']
+            if any(dep not in results for dep in step['after']):
+                continue
+            eligible_since.setdefault(name, now)
+
+            if step['done'] and _check(step['done'], driver, context):
+                results[name] = ('skipped', 0.0)
+                logger.info(f"步骤已满足，跳过: {name}", extra={'step': name, 'duration': 0.0, 'outcome': 'skipped'})
+                pending.remove(step)
+                progressed = True
+                continue
+
+            element = _check(selector_condition(step['ready'], 'clickable'), driver, context)
+            if not element:
+                timeout = get_timeout(name, CONFIG[step['timeout']])
+                fail_fast = selector_fail_fast(step['ready'])
+                if fail_fast is not None:
+                    timeout = min(timeout, fail_fast)
+                if time.perf_counter() - eligible_since[name] > timeout:
+                    record_selector_result(step['ready'], False, time.perf_counter() - eligible_since[name])
+                    metrics_inc('step_failures_total', step=name)
+                    logger.info(f"步骤超时: {name}", extra={
+                        'step': name, 'duration': time.perf_counter() - eligible_since[name], 'outcome': 'timeout'})
+                    raise TimeoutException(f"导入步骤 '{name}' 在 {timeout:.0f} 秒内未就绪")
+                continue
+
+            record_latency(name, time.perf_counter() - eligible_since[name])
+            record_selector_result(step['ready'], True, time.perf_counter() - eligible_since[name])
+            try:
+                step['action'](driver, context, element)
+                if step['done'] or step.get('abort'):
+                    # 同时等待 done 和 abort: 放弃条件（如产品已存在）出现时 done 永远不会成立
+                    reason = wait_until(driver, f'{name}_done', lambda d: _step_settled(step, d, context))
+                else:
+                    reason = True
+            except Exception:
+                metrics_inc('step_failures_total', step=name)
+                raise
+            if reason is not True:
+                raise ImportAborted(reason)
+
+            duration = time.perf_counter() - eligible_since[name]
+            results[name] = ('ok', duration)
+            logger.info(f"步骤完成: {name}", extra={'step': name, 'duration': duration, 'outcome': 'ok'})
+            note_timing('steps', duration)
+            pending.remove(step)
+            progressed = True
+
+        if pending and not progressed:
+            pause(STEP_POLL_INTERVAL)
+
+    return results
+
+
+def perform_import_steps(driver, sheet_name):
+    """按导入步骤图执行产品导入"""
+    # 确保 sheet_name 是字符串而不是列表
+    if isinstance(sheet_name, list):
+        sheet_name = sheet_name[0]
+    try:
+        return run_import_steps(driver, IMPORT_STEPS, {'sheet_name': sheet_name})
+    except ImportAborted:
+        raise
     except Exception as e:
         logger.error(f"执行导入步骤时出错: {e}")
+        capture_failure_snapshot(driver, 'import_steps', e)
         raise
 
 
+# 每次通过网络事件检测到的导入结果: {'url', 'status', 'ok', 'latency'}
+IMPORT_TIMINGS = []
+
+
+def drain_performance_log(driver):
+    """清空性能日志缓冲区，避免把之前的请求误判为本次导入"""
+    if CONFIG['IMPORT_DETECTION'] != 'network':
+        return
+    try:
+        driver.get_log('performance')
+    except Exception as e:
+        logger.warning(f"读取性能日志失败: {e}")
+
+
+def wait_for_import_response(driver, timeout=None):
+    """
+    监听 Network.responseReceived 事件，直接检测 Importify 创建产品接口的响应。
+    返回 True/False 表示成功或失败；无法读取性能日志时返回 None，由调用方回退到 DOM 检测。
+    """
+    if timeout is None:
+        timeout = CONFIG['IMPORT_TIMEOUT']
+
+    pattern = re.compile(CONFIG['IMPORTIFY_CREATE_URL_PATTERN'], re.IGNORECASE)
+    sent_at = {}
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            entries = driver.get_log('performance')
+        except Exception as e:
+            logger.warning(f"读取性能日志失败，回退到页面检测: {e}")
+            return None
+
+        for entry in entries:
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            method = message.get('method')
+            params = message.get('params', {})
+
+            if method == 'Network.requestWillBeSent':
+                if pattern.search(params.get('request', {}).get('url', '')):
+                    sent_at[params.get('requestId')] = params.get('timestamp')
+            elif method == 'Network.responseReceived':
+                response = params.get('response', {})
+                url = response.get('url', '')
+                if not pattern.search(url):
+                    continue
+
+                status = response.get('status', 0)
+                ok = 200 <= status < 300
+                # 优先使用服务器处理时间（发送完成到收到响应头），否则用事件时间差
+                timing = response.get('timing') or {}
+                if 'sendEnd' in timing and 'receiveHeadersEnd' in timing:
+                    latency = (timing['receiveHeadersEnd'] - timing['sendEnd']) / 1000
+                elif params.get('requestId') in sent_at:
+                    latency = params.get('timestamp', 0) - sent_at[params['requestId']]
+                else:
+                    latency = None
+
+                IMPORT_TIMINGS.append({'url': url, 'status': status, 'ok': ok, 'latency': latency})
+                latency_text = f"{latency:.2f}秒" if latency is not None else "未知"
+                if ok:
+                    logger.info(f"产品导入成功 (HTTP {status}, 服务器耗时 {latency_text})")
+                else:
+                    logger.error(f"产品导入失败 (HTTP {status}, 服务器耗时 {latency_text}): {url}")
+                    capture_failure_snapshot(driver, 'import_response', f"HTTP {status}")
+                return ok
+
+        pause(CONFIG['NETWORK_POLL_INTERVAL'])
+
+    logger.warning(f"导入超时（{timeout}秒），未检测到创建产品接口的响应")
+    capture_failure_snapshot(driver, 'import_timeout')
+    return False
+
+
 def wait_for_import_completion(driver, timeout=None):
     """优化的导入完成等待函数"""
     if timeout is None:
-        timeout = CONFIG['IMPORT_TIMEOUT']
+        timeout = get_timeout('import_completion', CONFIG['IMPORT_TIMEOUT'])
+
+    start = time.perf_counter()
+    if CONFIG['IMPORT_DETECTION'] == 'network':
+        result = wait_for_import_response(driver, timeout)
+        if result is not None:
+            if result:
+                record_latency('import_completion', time.perf_counter() - start)
+            return result
 
     try:
         # 等待导入容器出现
-        WebDriverWait(driver, CONFIG['WAIT_TIMEOUT']).until(
-            EC.presence_of_element_located((By.ID, 'importify-app-container')))
+        wait_for(driver, 'import_container')
         logger.info("产品导入进行中...")
 
         # 使用显式等待检查成功消息
-        success_xpath = '//div[@class="textcontainer centeralign home-content "]/p[1]'
-        success_condition = EC.text_to_be_present_in_element(
-            (By.XPATH, success_xpath),
-            "We have successfully created the product page."
-        )
+        def success_condition(d):
+            try:
+                message = find_one(d, 'import_message')
+                return message is not None and "We have successfully created the product page." in message.text
+            except StaleElementReferenceException:
+                return False
 
         try:
-            WebDriverWait(driver, timeout).until(success_condition)
+            wait_until(driver, 'import_completion', success_condition, timeout, max_timeout=timeout)
             logger.info("产品导入成功")
             return True
         except TimeoutException:
             logger.warning(f"导入超时（{timeout}秒）")
+            capture_failure_snapshot(driver, 'import_timeout')
             return False
 
     except Exception as e:
         logger.error(f"等待导入完成时出错: {e}")
+        capture_failure_snapshot(driver, 'import_completion', e)
         return False
 
 
+def get_run_mode():
+    """命令行第一个参数优先于 CONFIG['RUN_MODE']；--refresh 强制刷新搜索缓存"""
+    if '--refresh' in sys.argv:
+        CONFIG['SEARCH_CACHE_REFRESH'] = True
+        sys.argv.remove('--refresh')
+    if len(sys.argv) > 1 and sys.argv[1] in RUN_MODES:
+        return sys.argv[1]
+    return CONFIG['RUN_MODE']
+
+
 def main():
+    setup_logging()
+    start_metrics_server()
     try:
+        mode = get_run_mode()
+        logger.info(f"运行模式: {mode}")
+        # 命令行第二个参数可指定采集文件路径
+        if mode != 'full' and len(sys.argv) > 2:
+            CONFIG['HARVEST_FILE'] = sys.argv[2]
+
+        if mode == 'dedup_benchmark':
+            run_dedup_benchmark()
+            input("已完成所有内容")
+            return
+
+        if mode == 'benchmark':
+            run_browser_benchmark()
+            input("已完成所有内容")
+            return
+
+        if mode == 'import':
+            # 导入模式直接读取采集文件，无需 Excel 和搜索
+            with open_browser() as driver:
+                if not driver:
+                    logger.error("无法启动浏览器。")
+                    return
+                import_harvest_file(driver, CONFIG['HARVEST_FILE'])
+                driver.quit()
+            input("已完成所有内容")
+            return
+
         file_path = browse_excel_file()
         if not file_path:
             logger.error("未选择Excel文件。")
@@ -674,6 +3384,13 @@ def main():
             return
         logger.info(f"从Excel文件中读取的要导入的产品名称: {selected_categories}")
 
+        if mode == 'harvest' and CONFIG['SEARCH_BACKEND'] == 'http':
+            # HTTP 搜索采集不需要浏览器，使用上次保存的会话 Cookie
+            harvest_categories(None, selected_categories, read_sheet_names_from_excel(file_path),
+                               CONFIG['HARVEST_FILE'])
+            input("已完成所有内容")
+            return
+
         with open_browser() as driver:
             if not driver:
                 logger.error("无法启动浏览器。")
@@ -686,9 +3403,15 @@ def main():
                 return
             logger.info(f"从Excel文件中读取的工作表名称: {sheet_name}")
 
-            # 调用 open_alibaba() 函数，并传递 driver、selected_categories 和 sheet_names
-            open_alibaba(driver, selected_categories, sheet_name)
+            if mode == 'harvest':
+                harvest_categories(driver, selected_categories, sheet_name, CONFIG['HARVEST_FILE'])
+                driver.quit()
+            else:
+                # 调用 open_alibaba() 函数，并传递 driver、selected_categories 和 sheet_names
+                open_alibaba(driver, selected_categories, sheet_name)
 
+    except RunAborted as e:
+        logger.error(f"运行已停止: {e}")
     except Exception as e:
         pass
     input("已完成所有内容")